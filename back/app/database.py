@@ -1,8 +1,9 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, text
 from sqlalchemy.orm import sessionmaker
 from app.models import Base
 import os
 import time
+import orjson
 import logging
 
 logger = logging.getLogger(__name__)
@@ -12,8 +13,113 @@ DATABASE_URL = os.getenv(
     "postgresql+psycopg://postgres:postgres@db:5432/hackathon"
 )
 
-engine = create_engine(DATABASE_URL)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# Colonnes JSON (raw_data, features...) sérialisées avec orjson plutôt que le module json
+engine = create_engine(
+    DATABASE_URL,
+    json_serializer=lambda obj: orjson.dumps(obj).decode(),
+    json_deserializer=orjson.loads
+)
+SessionLocal = sessionmaker(autocommit=False, autoflush=False, expire_on_commit=False, bind=engine)
+
+# Changements de schéma postérieurs à la création initiale des tables: create_all
+# ne modifie pas les tables existantes, on les applique donc explicitement (index
+# créés CONCURRENTLY pour ne pas verrouiller les tables en écriture).
+MIGRATIONS = [
+    "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_gateway_status_eol "
+    "ON gateway_versions (status, end_of_life_date)",
+]
+
+# Compression LZ4 des blobs raw_data (PostgreSQL 14+)
+RAW_DATA_TABLES = ["product_models", "gateway_versions", "edge_versions", "orchestrator_versions"]
+
+
+# Index unique ajouté sur une base existante, qui peut contenir des doublons de model_name
+PRODUCT_MODEL_NAME_INDEX = "uq_product_models_model_name"
+CREATE_PRODUCT_MODEL_NAME_INDEX = (
+    f"CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS {PRODUCT_MODEL_NAME_INDEX} "
+    "ON product_models (model_name)"
+)
+# Doublons créés avant la contrainte unique, à résoudre à la main (aucune ligne n'est supprimée ici)
+FIND_DUPLICATE_PRODUCT_MODELS = (
+    "SELECT model_name, COUNT(*) FROM product_models "
+    "GROUP BY model_name HAVING COUNT(*) > 1 ORDER BY model_name"
+)
+
+
+def index_state(conn, index_name: str):
+    """True si l'index existe et est valide, False s'il est invalide (CONCURRENTLY échoué), None s'il n'existe pas"""
+    return conn.execute(
+        text(
+            "SELECT i.indisvalid FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid "
+            "WHERE c.relname = :name"
+        ),
+        {"name": index_name}
+    ).scalar()
+
+
+def create_product_model_name_index(conn):
+    """
+    Crée l'index unique sur product_models.model_name (requis par l'INSERT ... ON CONFLICT des produits).
+    Un index laissé invalide par un échec précédent est supprimé (IF NOT EXISTS le garderait
+    indéfiniment sans que la contrainte s'applique). Si la table contient des doublons, ils sont
+    listés dans les logs et la migration échoue: c'est à l'exploitant de choisir les lignes à garder.
+    """
+    state = index_state(conn, PRODUCT_MODEL_NAME_INDEX)
+    if state:
+        return
+    if state is False:
+        conn.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {PRODUCT_MODEL_NAME_INDEX}"))
+    
+    duplicates = conn.execute(text(FIND_DUPLICATE_PRODUCT_MODELS)).all()
+    if duplicates:
+        for model_name, count in duplicates:
+            logger.error(f"Modèle en double dans product_models: {model_name!r} ({count} lignes)")
+        raise Exception(
+            f"{len(duplicates)} model_name en double dans product_models: supprimez les doublons "
+            f"avant la création de l'index {PRODUCT_MODEL_NAME_INDEX}"
+        )
+    conn.execute(text(CREATE_PRODUCT_MODEL_NAME_INDEX))
+
+
+def apply_raw_data_compression(conn, table: str):
+    """
+    Passe raw_data en compression LZ4 si ce n'est pas déjà fait: ALTER TABLE prend un verrou
+    ACCESS EXCLUSIVE, il n'est donc exécuté qu'une fois et pas à chaque démarrage.
+    """
+    compression = conn.execute(
+        text(
+            "SELECT attcompression FROM pg_attribute "
+            "WHERE attrelid = CAST(:table AS regclass) AND attname = 'raw_data'"
+        ),
+        {"table": table}
+    ).scalar()
+    if compression != "l":
+        conn.execute(text(f"ALTER TABLE {table} ALTER COLUMN raw_data SET COMPRESSION lz4"))
+
+
+def apply_migrations():
+    """Applique les migrations idempotentes sur une base déjà existante"""
+    # CREATE INDEX CONCURRENTLY ne peut pas s'exécuter dans une transaction
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        # Sans cet index, l'enregistrement des produits échouerait: une erreur arrête le démarrage
+        create_product_model_name_index(conn)
+        
+        for statement in MIGRATIONS:
+            try:
+                conn.execute(text(statement))
+            except Exception as e:
+                logger.warning(f"Migration ignorée ({statement}): {e}")
+        
+        for table in RAW_DATA_TABLES:
+            try:
+                apply_raw_data_compression(conn, table)
+            except Exception as e:
+                logger.warning(f"Compression LZ4 de {table}.raw_data ignorée: {e}")
+        
+        # L'index unique sert aussi aux recherches par model_name: l'ancien index simple
+        # est redondant, mais n'est supprimé qu'une fois l'index unique valide
+        if index_state(conn, PRODUCT_MODEL_NAME_INDEX):
+            conn.execute(text("DROP INDEX CONCURRENTLY IF EXISTS ix_product_models_model_name"))
 
 
 def init_db():
@@ -24,6 +130,7 @@ def init_db():
     for attempt in range(max_retries):
         try:
             Base.metadata.create_all(bind=engine)
+            apply_migrations()
             logger.info("Database initialized successfully")
             return
         except Exception as e:
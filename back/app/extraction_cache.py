@@ -0,0 +1,60 @@
+"""Cache disque des extractions LLM, indexé par le contenu des PDFs"""
+from typing import Dict, Any, Optional
+from datetime import datetime, timezone
+import hashlib
+import mmap
+import orjson
+import os
+import threading
+
+
+CACHE_DIR = os.getenv("EXTRACTION_CACHE_DIR", "./.cache/extractions")
+
+
+def file_sha256(path: str) -> str:
+    """Calcule le sha256 du contenu d'un fichier (fichier mappé en mémoire, sans copie par blocs)"""
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return hashlib.sha256().hexdigest()  # mmap refuse les fichiers vides
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            return hashlib.sha256(mapped).hexdigest()
+
+
+def provider_id() -> str:
+    """Identifiant du provider et du modèle LLM configurés (ex: 'openai:gpt-4o')"""
+    provider_name = os.getenv("LLM_PROVIDER", "openai").lower()
+    model = os.getenv(f"{provider_name.upper()}_MODEL", "")
+    return f"{provider_name}:{model}"
+
+
+def make_key(namespace: str, prompt_version: str, filename: str, pdf_sha256: str) -> str:
+    """Construit la clé de cache: (provider, modèle, prompt, fichier, contenu du PDF)"""
+    raw_key = "|".join([namespace, provider_id(), prompt_version, filename, pdf_sha256])
+    return hashlib.sha256(raw_key.encode("utf-8")).hexdigest()
+
+
+def load(key: str) -> Optional[Dict[str, Any]]:
+    """Retourne les données en cache pour cette clé, None si absentes ou invalides"""
+    try:
+        with open(os.path.join(CACHE_DIR, f"{key}.json"), "rb") as f:
+            entry = orjson.loads(f.read())
+    except (OSError, ValueError):
+        return None
+
+    data = entry.get("data") if isinstance(entry, dict) else None
+    return data if isinstance(data, dict) else None
+
+
+def store(key: str, data: Dict[str, Any]) -> None:
+    """Enregistre le résultat d'une extraction LLM"""
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    entry = {
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "data": data
+    }
+    # Écriture dans un fichier temporaire puis renommage: une entrée n'est jamais lue à moitié écrite
+    path = os.path.join(CACHE_DIR, f"{key}.json")
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(orjson.dumps(entry))
+    os.replace(tmp_path, path)
@@ -0,0 +1,96 @@
+"""Schémas des réponses JSON des extractions LLM, validés avec pydantic"""
+from typing import Dict, Any, List, Optional, Type, TypeVar
+from datetime import date
+import re
+from pydantic import BaseModel, ConfigDict, ValidationError
+from app.llm_provider import LLMProvider
+
+
+# Nombre de nouvelles demandes au LLM quand sa réponse ne respecte pas le schéma
+MAX_VALIDATION_RETRIES = 2
+
+# Dates renvoyées par le LLM: DD/MM/YYYY
+_DATE_RE = re.compile(r"(\d{2})/(\d{2})/(\d{4})")
+
+
+class LLMRecord(BaseModel):
+    """Base des objets renvoyés par le LLM: les champs non prévus sont conservés (raw_data)"""
+    model_config = ConfigDict(extra="allow")
+
+
+class ProductRecord(LLMRecord):
+    model_name: Optional[str] = None
+    product_type: Optional[str] = None
+    end_of_life_date: Optional[str] = None
+    end_of_support_date: Optional[str] = None
+    status: Optional[str] = None
+    functionalities: Optional[List[str]] = None
+    alternatives: Optional[List[str]] = None
+    release_date: Optional[str] = None
+    description: Optional[str] = None
+    notes: Optional[str] = None
+
+
+class ProductExtraction(LLMRecord):
+    document_date: Optional[str] = None
+    products: List[ProductRecord] = []
+
+
+class VersionRecord(LLMRecord):
+    version: Optional[str] = None
+    document_date: Optional[str] = None
+    release_date: Optional[str] = None
+    end_of_life_date: Optional[str] = None
+    end_of_support_date: Optional[str] = None
+    status: Optional[str] = None
+    features: Optional[List[str]] = None
+    upgrade_instructions: Optional[List[str]] = None
+    notes: Optional[str] = None
+
+
+class GatewayEdgeExtraction(LLMRecord):
+    document_type: Optional[str] = None
+    gateways: List[VersionRecord] = []
+    edges: List[VersionRecord] = []
+    orchestrators: List[VersionRecord] = []
+    general_info: Optional[Dict[str, Any]] = None
+    skipped: bool = False
+
+
+class GatewayEdgeBatchExtraction(LLMRecord):
+    """Réponse groupée pour plusieurs PDFs, indexée par nom de fichier"""
+    documents: Dict[str, GatewayEdgeExtraction] = {}
+
+
+Extraction = TypeVar("Extraction", bound=BaseModel)
+
+
+def end_of_life_reached(end_of_life_date: Optional[str]) -> bool:
+    """Vrai si la date de fin de vie (DD/MM/YYYY) est passée, calculé au moment de l'enregistrement"""
+    match = _DATE_RE.fullmatch(end_of_life_date.strip()) if end_of_life_date else None
+    if not match:
+        return False
+    day, month, year = (int(part) for part in match.groups())
+    try:
+        return date(year, month, day) < date.today()
+    except ValueError:
+        return False
+
+
+def extract_validated(provider: LLMProvider, system: str, user: str, schema: Type[Extraction]) -> Extraction:
+    """
+    Appelle le LLM et valide sa réponse avec le schéma.
+    Si la réponse est invalide, elle est redemandée avec l'erreur de validation (MAX_VALIDATION_RETRIES fois).
+    """
+    prompt = user
+    for _ in range(MAX_VALIDATION_RETRIES + 1):
+        try:
+            return schema.model_validate(provider.extract_info(system, prompt))
+        except ValidationError as e:
+            error = e
+            prompt = (
+                f"{user}\n\nTa réponse précédente ne respecte pas le format attendu:\n{e}\n"
+                "Corrige-la et renvoie uniquement le JSON complet."
+            )
+
+    raise Exception(f"Réponse du LLM invalide après {MAX_VALIDATION_RETRIES + 1} tentatives: {str(error)}")
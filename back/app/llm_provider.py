@@ -1,7 +1,16 @@
 from abc import ABC, abstractmethod
 from typing import Dict, Any, List, Optional, Callable
+from functools import lru_cache
 import os
 import json
+import orjson
+import hashlib
+
+
+@lru_cache(maxsize=32)
+def prompt_cache_key(system: str) -> str:
+    """Clé de cache de préfixe côté provider, dérivée du message système"""
+    return hashlib.sha256(system.encode("utf-8")).hexdigest()[:32]
 
 
 class LLMProvider(ABC):
@@ -11,8 +20,12 @@ class LLMProvider(ABC):
         self.api_key = api_key
     
     @abstractmethod
-    def extract_info(self, text: str, prompt: str) -> Dict[str, Any]:
-        """Extrait les informations structurées d'un texte avec un prompt personnalisé"""
+    def extract_info(self, system: str, user: str) -> Dict[str, Any]:
+        """
+        Extrait les informations structurées d'un document.
+        system: instructions et schéma JSON, identiques d'un document à l'autre (cache de préfixe du provider)
+        user: partie variable (nom du fichier, texte du document)
+        """
         pass
     
     @abstractmethod
@@ -46,20 +59,23 @@ class OpenAIProvider(LLMProvider):
         self.client = OpenAI(api_key=api_key)
         self.model = model
     
-    def extract_info(self, text: str, prompt: str) -> Dict[str, Any]:
+    def extract_info(self, system: str, user: str) -> Dict[str, Any]:
         """Extrait les informations avec un prompt personnalisé"""
         try:
             response = self.client.chat.completions.create(
                 model=self.model,
                 messages=[
-                    {"role": "system", "content": "Tu es un assistant qui extrait des informations structurées de documents techniques."},
-                    {"role": "user", "content": prompt}
+                    {"role": "system", "content": system},
+                    {"role": "user", "content": user}
                 ],
                 temperature=0.1,
-                response_format={"type": "json_object"}
+                response_format={"type": "json_object"},
+                # Même clé pour tous les appels d'une même extraction: les requêtes sont routées
+                # vers les serveurs qui ont déjà le préfixe (message système) en cache
+                prompt_cache_key=prompt_cache_key(system)
             )
             
-            result = json.loads(response.choices[0].message.content)
+            result = orjson.loads(response.choices[0].message.content)
             return result
         except Exception as e:
             raise Exception(f"Erreur lors de l'appel à OpenAI: {str(e)}")
@@ -144,7 +160,7 @@ class OpenAIProvider(LLMProvider):
                     for tool_call in message.tool_calls:
                         # Exécuter le tool
                         function_name = tool_call.function.name
-                        function_args = json.loads(tool_call.function.arguments)
+                        function_args = orjson.loads(tool_call.function.arguments)
                         
                         tool_calls_log.append({
                             "iteration": iteration,
@@ -155,12 +171,13 @@ class OpenAIProvider(LLMProvider):
                         # Exécuter la fonction
                         function_result = tool_executor(function_name, function_args)
                         
-                        # Ajouter le résultat aux messages
+                        # Ajouter le résultat aux messages (orjson: UTF-8 non échappé comme
+                        # ensure_ascii=False, plus rapide sur les contenus de PDF renvoyés par les tools)
                         messages.append({
                             "role": "tool",
                             "tool_call_id": tool_call.id,
                             "name": function_name,
-                            "content": json.dumps(function_result, ensure_ascii=False)
+                            "content": orjson.dumps(function_result).decode()
                         })
                 else:
                     # Pas de tool calls, on a la réponse finale
@@ -168,15 +185,15 @@ class OpenAIProvider(LLMProvider):
                     
                     # Essayer de parser le JSON
                     try:
-                        result = json.loads(content)
+                        result = orjson.loads(content)
                     except:
                         import re
                         json_match = re.search(r'```json\s*({.*?})\s*```', content, re.DOTALL)
                         if json_match:
-                            result = json.loads(json_match.group(1))
+                            result = orjson.loads(json_match.group(1))
                         else:
                             try:
-                                result = json.loads(content)
+                                result = orjson.loads(content)
                             except:
                                 result = {"reasoning": content, "steps": []}
                     
@@ -210,13 +227,13 @@ class GrokProvider(LLMProvider):
         )
         self.model = model
     
-    def extract_info(self, text: str, prompt: str) -> Dict[str, Any]:
+    def extract_info(self, system: str, user: str) -> Dict[str, Any]:
         try:
             response = self.client.chat.completions.create(
                 model=self.model,
                 messages=[
-                    {"role": "system", "content": "Tu es un assistant qui extrait des informations structurées de documents techniques."},
-                    {"role": "user", "content": prompt}
+                    {"role": "system", "content": system},
+                    {"role": "user", "content": user}
                 ],
                 temperature=0.1
             )
@@ -226,13 +243,13 @@ class GrokProvider(LLMProvider):
             
             # Essayer de parser directement
             try:
-                result = json.loads(content)
-            except json.JSONDecodeError:
+                result = orjson.loads(content)
+            except orjson.JSONDecodeError:
                 # Si échec, chercher le JSON dans le texte
                 import re
                 json_match = re.search(r'\{.*\}', content, re.DOTALL)
                 if json_match:
-                    result = json.loads(json_match.group())
+                    result = orjson.loads(json_match.group())
                 else:
                     raise Exception("Impossible de parser la réponse JSON")
             
@@ -291,11 +308,20 @@ class GeminiProvider(LLMProvider):
         import google.generativeai as genai
         genai.configure(api_key=api_key)
         self.model = genai.GenerativeModel(model)
+        self.model_name = model
+        # Un modèle par message système (system_instruction est fixé à la création du modèle)
+        self._extraction_models: Dict[str, Any] = {}
+    
+    def _extraction_model(self, system: str):
+        if system not in self._extraction_models:
+            import google.generativeai as genai
+            self._extraction_models[system] = genai.GenerativeModel(self.model_name, system_instruction=system)
+        return self._extraction_models[system]
     
-    def extract_info(self, text: str, prompt: str) -> Dict[str, Any]:
+    def extract_info(self, system: str, user: str) -> Dict[str, Any]:
         try:
-            response = self.model.generate_content(
-                prompt,
+            response = self._extraction_model(system).generate_content(
+                user,
                 generation_config={
                     "temperature": 0.1,
                     "response_mime_type": "application/json"
@@ -307,13 +333,13 @@ class GeminiProvider(LLMProvider):
             
             # Parser le JSON
             try:
-                result = json.loads(content)
-            except json.JSONDecodeError:
+                result = orjson.loads(content)
+            except orjson.JSONDecodeError:
                 # Si échec, chercher le JSON dans le texte
                 import re
                 json_match = re.search(r'\{.*\}', content, re.DOTALL)
                 if json_match:
-                    result = json.loads(json_match.group())
+                    result = orjson.loads(json_match.group())
                 else:
                     raise Exception("Impossible de parser la réponse JSON")
             
@@ -372,13 +398,13 @@ class GroqProvider(LLMProvider):
         )
         self.model = model
     
-    def extract_info(self, text: str, prompt: str) -> Dict[str, Any]:
+    def extract_info(self, system: str, user: str) -> Dict[str, Any]:
         try:
             response = self.client.chat.completions.create(
                 model=self.model,
                 messages=[
-                    {"role": "system", "content": "Tu es un assistant qui extrait des informations structurées de documents techniques."},
-                    {"role": "user", "content": prompt}
+                    {"role": "system", "content": system},
+                    {"role": "user", "content": user}
                 ],
                 temperature=0.1,
                 response_format={"type": "json_object"}
@@ -388,13 +414,13 @@ class GroqProvider(LLMProvider):
             content = response.choices[0].message.content
             
             try:
-                result = json.loads(content)
-            except json.JSONDecodeError:
+                result = orjson.loads(content)
+            except orjson.JSONDecodeError:
                 # Si échec, chercher le JSON dans le texte
                 import re
                 json_match = re.search(r'\{.*\}', content, re.DOTALL)
                 if json_match:
-                    result = json.loads(json_match.group())
+                    result = orjson.loads(json_match.group())
                 else:
                     raise Exception("Impossible de parser la réponse JSON")
             
@@ -481,7 +507,7 @@ class GroqProvider(LLMProvider):
                     for tool_call in message.tool_calls:
                         # Exécuter le tool
                         function_name = tool_call.function.name
-                        function_args = json.loads(tool_call.function.arguments)
+                        function_args = orjson.loads(tool_call.function.arguments)
                         
                         tool_calls_log.append({
                             "iteration": iteration,
@@ -492,12 +518,13 @@ class GroqProvider(LLMProvider):
                         # Exécuter la fonction
                         function_result = tool_executor(function_name, function_args)
                         
-                        # Ajouter le résultat aux messages
+                        # Ajouter le résultat aux messages (orjson: UTF-8 non échappé comme
+                        # ensure_ascii=False, plus rapide sur les contenus de PDF renvoyés par les tools)
                         messages.append({
                             "role": "tool",
                             "tool_call_id": tool_call.id,
                             "name": function_name,
-                            "content": json.dumps(function_result, ensure_ascii=False)
+                            "content": orjson.dumps(function_result).decode()
                         })
                 else:
                     # Pas de tool calls, on a la réponse finale
@@ -505,15 +532,15 @@ class GroqProvider(LLMProvider):
                     
                     # Essayer de parser le JSON
                     try:
-                        result = json.loads(content)
+                        result = orjson.loads(content)
                     except:
                         import re
                         json_match = re.search(r'```json\s*({.*?})\s*```', content, re.DOTALL)
                         if json_match:
-                            result = json.loads(json_match.group(1))
+                            result = orjson.loads(json_match.group(1))
                         else:
                             try:
-                                result = json.loads(content)
+                                result = orjson.loads(content)
                             except:
                                 result = {"reasoning": content, "steps": []}
                     
@@ -534,8 +561,12 @@ class GroqProvider(LLMProvider):
             raise Exception(f"Erreur lors de l'appel à Groq (tools): {str(e)}")
 
 
+@lru_cache(maxsize=1)
 def get_llm_provider() -> LLMProvider:
-    """Factory pour obtenir le provider LLM configuré"""
+    """
+    Factory pour obtenir le provider LLM configuré.
+    Construit une seule fois: le client HTTP (et ses connexions keep-alive) est partagé par tous les appels.
+    """
     provider_name = os.getenv("LLM_PROVIDER", "openai").lower()
     
     if provider_name == "openai":
@@ -570,8 +601,9 @@ def get_llm_provider() -> LLMProvider:
         raise Exception(f"Provider LLM non supporté: {provider_name}. Utilisez 'openai', 'grok', 'gemini' ou 'groq'")
 
 
+@lru_cache(maxsize=1)
 def get_analysis_llm_provider() -> LLMProvider:
-    """Factory pour obtenir le provider LLM configuré pour l'analyse avec reasoning + function calling"""
+    """Factory pour obtenir le provider LLM configuré pour l'analyse avec reasoning + function calling (construit une seule fois)"""
     provider_name = os.getenv("ANALYSIS_LLM_PROVIDER", os.getenv("LLM_PROVIDER", "openai")).lower()
     
     if provider_name == "openai":
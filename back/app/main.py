@@ -8,12 +8,34 @@ from app.pdf_processor import process_all_pdfs
 from app.version_processor import process_all_pdfs_gateway_edge
 from app.llm_provider import get_llm_provider, get_analysis_llm_provider
 from app.pdf_tools import PDF_RETRIEVAL_TOOLS, execute_pdf_tool, list_available_pdfs
+from app.pdf_pipeline import iter_pdf_files
 from typing import List, Any
 from pydantic import BaseModel
 from datetime import datetime
+from functools import lru_cache
 import os
+import re
 import json
 
+# Validation du plan d'upgrade: patterns compilés une seule fois au chargement du module
+UPGRADE_STEP_PATTERN = re.compile(r'^\d+\.\s+Mettre à jour', re.MULTILINE | re.IGNORECASE)
+VERSION_NUMBER_PATTERN = re.compile(r'\d+\.\d+\.\d+')
+# Mentions des composants en un seul parcours du texte, le groupe nommé indique le composant.
+# "Edge 840" (modèle d'Edge) compte comme mention d'Edge mais pas pour l'ordre des étapes
+COMPONENT_MENTION_PATTERN = re.compile(
+    r'(?P<orchestrator>Orchestrator)|(?P<gateway>Gateway)|(?P<edge_model>Edge(?=\s*\d))|(?P<edge>Edge)',
+    re.IGNORECASE
+)
+
+
+@lru_cache(maxsize=256)
+def version_pattern_regex(pattern: str) -> re.Pattern:
+    """Regex d'un pattern de version, compilée une fois par pattern"""
+    # Convertir pattern en regex: 5.X -> 5\.\d+, 5.0.X -> 5\.0\.\d+
+    regex_pattern = pattern.upper().replace('.', r'\.').replace('X', r'\d+')
+    return re.compile(f"^{regex_pattern}$")
+
+
 app = FastAPI(
     title="Bleu Hackathon Orange API",
     description="API pour le hackathon Bleu Orange",
@@ -78,8 +100,8 @@ async def process(background_tasks: BackgroundTasks, db: Session = Depends(get_d
         if not os.path.exists(assets_dir):
             raise HTTPException(status_code=404, detail=f"Dossier assets non trouvé: {assets_dir}")
         
-        pdf_files = [f for f in os.listdir(assets_dir) if f.endswith('.pdf')]
-        if not pdf_files:
+        # Même règle que le traitement (extension insensible à la casse), arrêt au premier PDF trouvé
+        if next(iter_pdf_files(assets_dir), None) is None:
             raise HTTPException(status_code=404, detail="Aucun fichier PDF trouvé dans le dossier assets")
         
         # Traiter les PDFs pour les produits
@@ -349,7 +371,6 @@ async def analyze_upgrade_path(request: UpgradeAnalysisRequest, db: Session = De
     }
     """
     try:
-        import re
         provider = get_llm_provider()
         current_date = datetime.now().strftime("%d/%m/%Y")
         
@@ -358,9 +379,8 @@ async def analyze_upgrade_path(request: UpgradeAnalysisRequest, db: Session = De
             if 'X' not in pattern and 'x' not in pattern:
                 return version == pattern
             
-            # Convertir pattern en regex: 5.X -> 5\.\d+, 5.0.X -> 5\.0\.\d+
-            regex_pattern = pattern.upper().replace('.', r'\.').replace('X', r'\d+')
-            return bool(re.match(f"^{regex_pattern}$", version))
+            # Le même pattern est testé pour chaque version en base: regex mise en cache
+            return bool(version_pattern_regex(pattern).match(version))
         
         # Construire le contexte enrichi
         context_parts = []
@@ -539,7 +559,6 @@ async def analyze_upgrade_with_pdfs(request: UpgradeAnalysisRequest, db: Session
     Note: Les PDFs fournis sont ceux des versions LTS finales, pas des versions actuelles.
     """
     try:
-        import re
         provider = get_analysis_llm_provider()  # Use dedicated analysis provider with function calling
         current_date = datetime.now().strftime("%d/%m/%Y")
         
@@ -808,18 +827,24 @@ EXEMPLE DU FORMAT ATTENDU:
                 text_result = str(result)
             
             # Vérifier que la réponse contient des étapes numérotées
-            import re
-            steps = re.findall(r'^\d+\.\s+Mettre à jour', text_result, re.MULTILINE | re.IGNORECASE)
+            steps = UPGRADE_STEP_PATTERN.findall(text_result)
             if len(steps) == 0:
                 comments.append("❌ CRITIQUE: Aucune étape d'upgrade numérotée trouvée")
                 score -= 50
             else:
                 comments.append(f"✅ {len(steps)} étapes d'upgrade détectées")
             
+            # Première position de chaque composant dans le plan, en un seul parcours du texte
+            first_positions = {}
+            for match in COMPONENT_MENTION_PATTERN.finditer(text_result):
+                first_positions.setdefault(match.lastgroup, match.start())
+                if len(first_positions) == COMPONENT_MENTION_PATTERN.groups:
+                    break
+            
             # Vérifier la présence des 3 composants dans le plan
-            has_orchestrator = bool(re.search(r'Orchestrator', text_result, re.IGNORECASE))
-            has_gateway = bool(re.search(r'Gateway', text_result, re.IGNORECASE))
-            has_edge = bool(re.search(r'Edge', text_result, re.IGNORECASE))
+            has_orchestrator = 'orchestrator' in first_positions
+            has_gateway = 'gateway' in first_positions
+            has_edge = 'edge' in first_positions or 'edge_model' in first_positions
             
             if not has_orchestrator:
                 comments.append("⚠️ MANQUANT: Aucune mise à jour d'Orchestrator trouvée")
@@ -835,24 +860,19 @@ EXEMPLE DU FORMAT ATTENDU:
                 comments.append("✅ Les 3 composants sont présents dans le plan")
             
             # Vérifier l'ordre des composants (Orchestrator avant Gateway avant Edge)
-            orchestrator_positions = [m.start() for m in re.finditer(r'Orchestrator', text_result, re.IGNORECASE)]
-            gateway_positions = [m.start() for m in re.finditer(r'Gateway', text_result, re.IGNORECASE)]
-            edge_positions = [m.start() for m in re.finditer(r'Edge(?!\s*\d)', text_result, re.IGNORECASE)]
-            
-            if orchestrator_positions and gateway_positions and edge_positions:
+            if {'orchestrator', 'gateway', 'edge'} <= first_positions.keys():
                 # Vérifier que le premier Orchestrator apparaît avant le premier Gateway
-                if orchestrator_positions[0] > gateway_positions[0]:
+                if first_positions['orchestrator'] > first_positions['gateway']:
                     comments.append("⚠️ ORDRE: Gateway mis à jour avant Orchestrator (ordre non respecté)")
                     score -= 15
                 
                 # Vérifier que le premier Gateway apparaît avant le premier Edge
-                if gateway_positions[0] > edge_positions[0]:
+                if first_positions['gateway'] > first_positions['edge']:
                     comments.append("⚠️ ORDRE: Edge mis à jour avant Gateway (ordre non respecté)")
                     score -= 15
             
             # Vérifier la présence de versions dans les étapes
-            version_pattern = r'\d+\.\d+\.\d+'
-            versions_found = re.findall(version_pattern, text_result)
+            versions_found = VERSION_NUMBER_PATTERN.findall(text_result)
             if len(versions_found) < 4:  # Au minimum 2 étapes avec from/to versions
                 comments.append("⚠️ VERSIONS: Peu de numéros de version détectés dans le plan")
                 score -= 10
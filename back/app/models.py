@@ -1,16 +1,22 @@
-from sqlalchemy import Column, Integer, String, DateTime, Text, JSON, Boolean, Date
+from sqlalchemy import Column, Integer, String, DateTime, Text, JSON, Boolean, Date, Index, UniqueConstraint
 from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.orm import deferred
 from datetime import datetime
 
 Base = declarative_base()
 
+__all__ = ["Base", "ProductModel", "GatewayVersion", "EdgeVersion", "OrchestratorVersion"]
+
 
 class ProductModel(Base):
     """Table pour stocker les informations générales des produits SD-WAN"""
     __tablename__ = "product_models"
+    __table_args__ = (
+        UniqueConstraint("model_name", name="uq_product_models_model_name"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
-    model_name = Column(String(255), nullable=False, index=True)
+    model_name = Column(String(255), nullable=False)  # Indexé par la contrainte unique
     product_type = Column(String(50), nullable=True)  # Edge, Gateway, Orchestrator
     is_end_of_life = Column(Boolean, default=False)
     end_of_life_date = Column(String(100), nullable=True)
@@ -23,7 +29,7 @@ class ProductModel(Base):
     description = Column(Text, nullable=True)
     notes = Column(Text, nullable=True)
     source_file = Column(String(255), nullable=True)  # Nom du PDF source
-    raw_data = Column(JSON, nullable=True)  # Données brutes extraites
+    raw_data = deferred(Column(JSON, nullable=True))  # Données brutes extraites, chargées à la demande
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
@@ -34,6 +40,9 @@ class ProductModel(Base):
 class GatewayVersion(Base):
     """Table pour les versions de Gateway SD-WAN (software uniquement)"""
     __tablename__ = "gateway_versions"
+    __table_args__ = (
+        Index("ix_gateway_status_eol", "status", "end_of_life_date"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     version = Column(String(100), nullable=False, index=True, unique=True)
@@ -47,7 +56,7 @@ class GatewayVersion(Base):
     upgrade_instructions = Column(JSON, nullable=True)  # Liste d'instructions pour l'upgrade
     notes = Column(Text, nullable=True)
     source_file = Column(String(255), nullable=True)
-    raw_data = Column(JSON, nullable=True)
+    raw_data = deferred(Column(JSON, nullable=True))  # Chargé uniquement à la demande
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
@@ -71,7 +80,7 @@ class EdgeVersion(Base):
     upgrade_instructions = Column(JSON, nullable=True)  # Liste d'instructions pour l'upgrade
     notes = Column(Text, nullable=True)
     source_file = Column(String(255), nullable=True)
-    raw_data = Column(JSON, nullable=True)
+    raw_data = deferred(Column(JSON, nullable=True))  # Chargé uniquement à la demande
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
@@ -95,7 +104,7 @@ class OrchestratorVersion(Base):
     upgrade_instructions = Column(JSON, nullable=True)  # Liste d'instructions pour l'upgrade
     notes = Column(Text, nullable=True)
     source_file = Column(String(255), nullable=True)
-    raw_data = Column(JSON, nullable=True)
+    raw_data = deferred(Column(JSON, nullable=True))  # Chargé uniquement à la demande
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
@@ -0,0 +1,188 @@
+"""Orchestration du traitement des PDFs: parsing, extraction LLM et cache"""
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+import multiprocessing
+from typing import Dict, Any, Callable, Iterable, Iterator, List, Optional, Tuple, Union
+import os
+from app import extraction_cache, text_cache
+
+
+# Parsing PDF (CPU) sur tous les coeurs sauf un, appels LLM (I/O) en threads
+PDF_PARSE_WORKERS = max(1, (os.cpu_count() or 2) - 1)
+LLM_WORKERS = int(os.getenv("LLM_WORKERS", "16"))
+# Workers de parsing démarrés par un serveur forkserver et non par fork du process de l'API
+# (threads du serveur, connexions à la base et clients HTTP ne sont pas copiés dans les workers)
+PARSE_MP_CONTEXT = multiprocessing.get_context("forkserver")
+
+# Vrai dans les process workers de parsing: les gros PDFs n'y créent pas de pool imbriqué
+_in_parse_worker = False
+
+# Écritures en base: un commit pour ce nombre de PDFs enregistrés (et un dernier en fin de lot)
+COMMIT_EVERY_FILES = 50
+
+# (chemin du PDF, sha256 déjà calculé) -> texte envoyé au LLM
+ParseFunction = Callable[[str, Optional[str]], str]
+ExtractFunction = Callable[[str, str], Dict[str, Any]]
+# [(texte, nom du fichier)] -> données extraites (ou erreur propre au fichier) par nom de fichier
+BatchExtractFunction = Callable[[List[Tuple[str, str]]], Dict[str, Union[Dict[str, Any], Exception]]]
+
+
+def _mark_parse_worker() -> None:
+    global _in_parse_worker
+    _in_parse_worker = True
+
+
+def in_parse_worker() -> bool:
+    """Vrai si le code s'exécute dans un process worker de parsing de iter_extractions"""
+    return _in_parse_worker
+
+
+def is_pdf_file(name: str) -> bool:
+    """Règle unique de reconnaissance des PDFs, pour l'ingestion comme pour les tools (.pdf, .PDF...)"""
+    return name.lower().endswith('.pdf')
+
+
+def iter_pdf_entries(assets_dir: str, recursive: bool = False) -> Iterator[os.DirEntry]:
+    """Entrées des PDFs du dossier (os.scandir: type et stat du fichier mis en cache par l'entrée)"""
+    pending = [assets_dir]
+    while pending:
+        with os.scandir(pending.pop()) as entries:
+            for entry in entries:
+                if entry.is_dir():
+                    if recursive:
+                        pending.append(entry.path)
+                elif entry.is_file() and is_pdf_file(entry.name):
+                    yield entry
+
+
+def iter_pdf_files(assets_dir: str) -> Iterator[str]:
+    """Noms des PDFs du dossier"""
+    for entry in iter_pdf_entries(assets_dir):
+        yield entry.name
+
+
+def extract_with_cache(
+    pdf_path: str,
+    filename: str,
+    parse: ParseFunction,
+    extract: ExtractFunction,
+    cache_namespace: str,
+    prompt_version: str
+) -> Dict[str, Any]:
+    """Extrait les informations d'un PDF, sans appel LLM si le même PDF a déjà été traité"""
+    digest = text_cache.file_digest(pdf_path)
+    cache_key = extraction_cache.make_key(cache_namespace, prompt_version, filename, digest)
+    cached = extraction_cache.load(cache_key)
+    if cached is not None:
+        return cached
+
+    extracted_data = extract(parse(pdf_path, digest), filename)
+    extraction_cache.store(cache_key, extracted_data)
+    return extracted_data
+
+
+def iter_extractions(
+    assets_dir: str,
+    pdf_files: Iterable[str],
+    parse: ParseFunction,
+    extract: ExtractFunction,
+    cache_namespace: str,
+    prompt_version: str,
+    extract_batch: Optional[BatchExtractFunction] = None,
+    batch_size: int = 1
+) -> Iterator[Tuple[str, Optional[Dict[str, Any]], Optional[Exception]]]:
+    """
+    Traite les PDFs en parallèle et renvoie (fichier, données extraites, erreur) au fil de l'eau.
+
+    1. Les PDFs déjà extraits (même contenu, même prompt) sont servis depuis le cache,
+       les PDFs au contenu identique (même sha256) ne sont parsés et extraits qu'une fois
+    2. Parsing des autres PDFs (CPU) en parallèle dans des process workers
+    3. Appels LLM (I/O) en parallèle dans des threads, dès qu'un texte est prêt
+       (ou dès que batch_size textes sont prêts avec extract_batch: un appel pour plusieurs PDFs)
+    4. Chaque extraction est rendue dès sa réponse LLM, sans attendre la fin du parsing des autres PDFs
+
+    L'écriture en base reste à la charge de l'appelant, sur son thread
+    (la Session SQLAlchemy n'est pas thread-safe).
+    """
+    with ProcessPoolExecutor(max_workers=PDF_PARSE_WORKERS, mp_context=PARSE_MP_CONTEXT,
+                             initializer=_mark_parse_worker) as parse_pool, \
+            ThreadPoolExecutor(max_workers=LLM_WORKERS) as llm_pool:
+        cached_results = []
+        cache_keys = {}
+        parse_futures = {}
+        first_files = {}  # sha256 -> premier fichier de ce contenu à extraire
+        same_content = {}  # premier fichier -> tous les fichiers servis par son extraction
+        for pdf_file in pdf_files:
+            pdf_path = os.path.join(assets_dir, pdf_file)
+            try:
+                # Le PDF est haché une seule fois: l'empreinte sert de clé de cache
+                # et est transmise au worker qui n'a pas à relire le fichier pour ça
+                digest = text_cache.file_digest(pdf_path)
+            except OSError as e:
+                cached_results.append((pdf_file, None, e))
+                continue
+
+            cache_key = extraction_cache.make_key(cache_namespace, prompt_version, pdf_file, digest)
+            cached = extraction_cache.load(cache_key)
+            if cached is not None:
+                cached_results.append((pdf_file, cached, None))
+                continue
+
+            cache_keys[pdf_file] = cache_key
+            first_file = first_files.setdefault(digest, pdf_file)
+            same_content.setdefault(first_file, []).append(pdf_file)
+            if first_file == pdf_file:
+                parse_futures[parse_pool.submit(parse, pdf_path, digest)] = pdf_file
+
+        # Les résultats en cache sont rendus pendant que les workers parsent
+        yield from cached_results
+
+        if extract_batch is None:
+            batch_size = 1
+            extract_batch = lambda batch: {pdf_file: extract(text, pdf_file) for text, pdf_file in batch}
+        
+        # Parsing et appels LLM se chevauchent: les textes parsés partent au LLM par lots,
+        # chaque réponse est rendue à l'appelant dès qu'elle arrive
+        llm_futures = {}
+        parsed = []  # (texte, fichier) en attente d'un lot complet
+        parses_left = len(parse_futures)
+        pending = set(parse_futures)
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future in parse_futures:
+                    parses_left -= 1
+                    pdf_file = parse_futures[future]
+                    try:
+                        parsed.append((future.result(), pdf_file))
+                    except Exception as e:
+                        for same_file in same_content[pdf_file]:
+                            yield same_file, None, e
+                    continue
+                
+                batch_files = llm_futures[future]
+                try:
+                    batch_results = future.result()
+                except Exception as e:
+                    for pdf_file in batch_files:
+                        for same_file in same_content[pdf_file]:
+                            yield same_file, None, e
+                    continue
+                for pdf_file in batch_files:
+                    extracted_data = batch_results.get(pdf_file)
+                    for same_file in same_content[pdf_file]:
+                        if extracted_data is None:
+                            yield same_file, None, Exception(f"Aucune donnée extraite pour {same_file}")
+                            continue
+                        if isinstance(extracted_data, Exception):
+                            # Échec propre à ce fichier: les autres fichiers du lot restent valides
+                            yield same_file, None, extracted_data
+                            continue
+                        extraction_cache.store(cache_keys[same_file], extracted_data)
+                        yield same_file, extracted_data, None
+            
+            # Lots complets, puis le reste une fois tous les PDFs parsés
+            while parsed and (len(parsed) >= batch_size or parses_left == 0):
+                batch, parsed = parsed[:batch_size], parsed[batch_size:]
+                llm_future = llm_pool.submit(extract_batch, batch)
+                llm_futures[llm_future] = [pdf_file for _, pdf_file in batch]
+                pending.add(llm_future)
@@ -1,33 +1,45 @@
 import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+import unicodedata
+from collections import Counter
+from itertools import chain, islice
+import fitz  # PyMuPDF
 from pypdf import PdfReader
-from typing import Dict, Any
+from typing import Dict, Any, Callable, Iterable, Iterator, List, Optional
+from sqlalchemy import select
+from sqlalchemy.dialects.postgresql import insert
 from sqlalchemy.orm import Session
 from app.models import ProductModel
 from app.llm_provider import get_llm_provider
-from datetime import datetime
+from app.extraction_schemas import ProductExtraction, end_of_life_reached, extract_validated
+from app import prompt_cache, text_cache
+from app.token_budget import PAGE_SEPARATOR, TARGET_CHARS, pack_pages
+from app.pdf_pipeline import extract_with_cache, in_parse_worker, iter_extractions, iter_pdf_files, COMMIT_EVERY_FILES, PARSE_MP_CONTEXT, PDF_PARSE_WORKERS
 
 
-def extract_text_from_pdf(pdf_path: str) -> str:
-    """Extrait le texte d'un fichier PDF"""
-    try:
-        reader = PdfReader(pdf_path)
-        text = ""
-        for page in reader.pages:
-            text += page.extract_text() + "\n"
-        return text
-    except Exception as e:
-        raise Exception(f"Erreur lors de la lecture du PDF: {str(e)}")
+# Les sauts de ligne sont conservés (lignes des tableaux de cycle de vie), seuls les
+# espaces et les lignes vides en série sont réduits
+WHITESPACE_PATTERN = re.compile(r"[^\S\n]+")
+BLANK_LINES_PATTERN = re.compile(r"\s*\n\s*")
+DOT_LEADER_PATTERN = re.compile(r"\.{3,}")  # Points de suite des tables des matières
 
 
-def extract_info_with_llm(text: str, filename: str) -> Dict[str, Any]:
-    """Utilise le LLM configuré pour extraire les informations structurées du texte"""
-    provider = get_llm_provider()
-    current_date = datetime.now().strftime("%d/%m/%Y")
-    
-    prompt = f"""
-Analyse le texte suivant extrait d'un PDF sur des produits SD-WAN et extrait les informations générales des PRODUITS HARDWARE au format JSON.
+# Au-delà de ce nombre de pages, l'extraction est répartie par lots sur des process workers
+LARGE_PDF_MIN_PAGES = 200
+PROCESS_PAGE_BATCH = 50
+
+# PDF scanné (images sans texte): moins de MIN_TEXT_LAYER_CHARS caractères sur les premières pages
+TEXT_LAYER_PROBE_PAGES = 2
+MIN_TEXT_LAYER_CHARS = 50
 
-DATE ACTUELLE: {current_date}
+PRODUCT_PROMPT_VERSION = "7"  # À incrémenter à chaque modification du prompt (invalide le cache)
+
+# Instructions et schéma d'extraction des produits: message système identique pour tous les PDFs
+# (préfixe stable, mis en cache côté provider)
+PRODUCT_SYSTEM_PROMPT = """
+Tu es un assistant qui extrait des informations structurées de documents techniques.
+Analyse le texte fourni extrait d'un PDF sur des produits SD-WAN et extrait les informations générales des PRODUITS HARDWARE au format JSON.
 
 IMPORTANT - Définition d'un PRODUIT valide:
 ✓ PRODUIT VALIDE = modèle hardware physique avec numéro/référence spécifique
@@ -76,24 +88,23 @@ EXEMPLES INCORRECTS:
 
 Format JSON attendu (array de produits):
 
-{{
+{
   "document_date": "date de publication du document/PDF au format DD/MM/YYYY (chercher dans header, footer)",
   "products": [
-    {{
+    {
       "model_name": "nom du modèle complet (ex: Edge 710-W, Gateway, Edge 840 Wi-Fi)",
       "product_type": "Edge|Gateway|Orchestrator (déterminer selon le produit)",
-      "is_end_of_life": true/false (calculer automatiquement: true si end_of_life_date < DATE ACTUELLE, false sinon),
       "end_of_life_date": "date de fin de vie au format DD/MM/YYYY si mentionnée",
       "end_of_support_date": "date de fin de support au format DD/MM/YYYY si mentionnée",
-      "status": "Active|Deprecated|End of Life (déterminer en fonction de is_end_of_life)",
+      "status": "Active|Deprecated|End of Life (selon le document)",
       "functionalities": ["liste des fonctionnalités principales"],
       "alternatives": ["liste des produits alternatifs recommandés"],
       "release_date": "date de première release au format DD/MM/YYYY si mentionnée",
       "description": "résumé du produit hardware",
       "notes": "notes importantes sur EOL, migration, alternatives"
-    }}
+    }
   ]
-}}
+}
 
 IMPORTANT - FORMAT DES DATES:
 TOUTES les dates doivent être au format DD/MM/YYYY (jour/mois/année).
@@ -111,72 +122,273 @@ ATTENTION:
 - Si "Edge 840 et Edge 680" → créer DEUX entrées distinctes
 - Ne PAS inclure les numéros de version software dans model_name
 - TOUJOURS inclure le suffixe du modèle (-W, -5G, -LTE, Wi-Fi, Non-Wi-Fi) s'il est mentionné
-- Si aucun produit hardware n'est trouvé, retourner {{"products": []}}
+- Si aucun produit hardware n'est trouvé, retourner {"products": []}
 
-Nom du fichier: {filename}
+Réponds uniquement avec le JSON contenant TOUS les produits hardware trouvés, sans texte additionnel.
+"""
 
-Texte (premiers 8000 caractères pour détecter tous les produits):
-{text[:8000]}
+# Partie variable, envoyée dans le message utilisateur
+PRODUCT_USER_TEMPLATE = """Nom du fichier: {filename}
 
-Réponds uniquement avec le JSON contenant TOUS les produits hardware trouvés, sans texte additionnel.
+Texte:
+{text}
 """
+
+# Clé du cache de prompts: une réponse n'est réutilisée qu'avec la même version, les mêmes templates et le même schéma
+PRODUCT_PROMPT_PARTS = prompt_cache.prompt_parts(
+    PRODUCT_PROMPT_VERSION, PRODUCT_SYSTEM_PROMPT, PRODUCT_USER_TEMPLATE, schema=ProductExtraction
+)
+
+
+def extract_page_range(pdf_path: str, start: int, end: int) -> List[str]:
+    """Extrait le texte des pages [start, end[ (chaque worker ouvre son propre document)"""
+    with fitz.open(pdf_path) as doc:
+        return [doc[i].get_text() for i in range(start, end)]
+
+
+def iter_page_texts(pdf_path: str) -> Iterator[str]:
+    """Itère paresseusement sur le texte des pages d'un PDF"""
+    try:
+        doc = fitz.open(pdf_path)
+    except Exception:
+        # PDF que MuPDF ne sait pas ouvrir: repli sur pypdf
+        yield from (page.extract_text() or "" for page in PdfReader(pdf_path).pages)
+        return
+    
+    with doc:
+        for page in doc:
+            yield page.get_text()
+
+
+def parse_pdf_pages(pdf_path: str, check_text_layer: bool = False) -> List[str]:
+    """
+    Parse le texte de chaque page d'un PDF avec PyMuPDF, en parallèle pour les gros documents.
+    Avec check_text_layer, un PDF scanné est rejeté sur ses premières pages, déjà parsées,
+    avant la lecture du reste du document.
+    """
+    try:
+        with fitz.open(pdf_path) as doc:
+            page_count = doc.page_count
+    except Exception:
+        page_count = 0
+    
+    # MuPDF extrait rapidement les documents courants (et ne supporte pas le
+    # multithreading): lecture séquentielle, avec repli pypdf si besoin.
+    # Dans un worker du pipeline, les autres coeurs parsent déjà d'autres PDFs:
+    # pas de pool imbriqué (jusqu'à PDF_PARSE_WORKERS² process sinon)
+    if page_count <= LARGE_PDF_MIN_PAGES or in_parse_worker():
+        page_texts = iter_page_texts(pdf_path)
+        probe = list(islice(page_texts, TEXT_LAYER_PROBE_PAGES))
+        if check_text_layer:
+            require_text_layer(probe)
+        return probe + list(page_texts)
+    
+    # Gros document: lots de pages répartis sur des process workers
+    with ProcessPoolExecutor(max_workers=PDF_PARSE_WORKERS, mp_context=PARSE_MP_CONTEXT) as pool:
+        futures = [
+            pool.submit(extract_page_range, pdf_path, start, min(start + PROCESS_PAGE_BATCH, page_count))
+            for start in range(0, page_count, PROCESS_PAGE_BATCH)
+        ]
+        if check_text_layer:
+            try:
+                require_text_layer(futures[0].result())
+            except Exception:
+                for future in futures:
+                    future.cancel()
+                raise
+        return [page for future in futures for page in future.result()]
+
+
+def require_text_layer(pages: Iterable[str]) -> None:
+    """Rejette un PDF sans couche texte (scanné), au vu de ses TEXT_LAYER_PROBE_PAGES premières pages"""
+    if sum(len(page.strip()) for page in islice(pages, TEXT_LAYER_PROBE_PAGES)) < MIN_TEXT_LAYER_CHARS:
+        raise Exception("pas de couche texte (PDF scanné)")
+
+
+def extract_pages_from_pdf(pdf_path: str, sha256: Optional[str] = None, check_text_layer: bool = False) -> List[str]:
+    """
+    Extrait le texte de chaque page d'un fichier PDF (mis en cache sur disque, les PDFs ne changent pas).
+    Avec check_text_layer, un PDF scanné est rejeté (et n'est pas mis en cache).
+    """
+    try:
+        digest = sha256 or text_cache.file_digest(pdf_path)
+        pages = text_cache.load_pages(digest)
+        if pages is None:
+            pages = parse_pdf_pages(pdf_path, check_text_layer)
+            text_cache.store_pages(digest, pages)
+        elif check_text_layer:
+            require_text_layer(pages)
+        return pages
+    except Exception as e:
+        raise Exception(f"Erreur lors de la lecture du PDF: {str(e)}")
+
+
+def extract_leading_text(
+    pdf_path: str,
+    sha256: Optional[str] = None,
+    max_chars: int = TARGET_CHARS,
+    keep_page: Optional[Callable[[str], Any]] = None
+) -> str:
+    """
+    Extrait le texte des premières pages seulement: la lecture s'arrête dès que max_chars
+    caractères sont lus (le reste du document ne serait pas envoyé au LLM).
+    Avec keep_page, seules la première page et les pages retenues par ce filtre sont gardées.
+    Un PDF sans couche texte (scanné) est rejeté dès ses premières pages, sans appel LLM.
+    """
+    try:
+        digest = sha256 or text_cache.file_digest(pdf_path)
+        cached_page_count = text_cache.page_count(digest)
+        if cached_page_count is not None:
+            page_texts = (text_cache.load_page(digest, i) or "" for i in range(cached_page_count))
+        else:
+            page_texts = iter_page_texts(pdf_path)
+        
+        page_texts = iter(page_texts)
+        probe = list(islice(page_texts, TEXT_LAYER_PROBE_PAGES))
+        require_text_layer(probe)
+        
+        pages = []
+        total_chars = 0
+        for page in chain(probe, page_texts):
+            if keep_page is not None and pages and not keep_page(page):
+                continue
+            pages.append(page)
+            total_chars += len(page)
+            if total_chars >= max_chars:
+                break
+        return PAGE_SEPARATOR.join(pages)
+    except Exception as e:
+        raise Exception(f"Erreur lors de la lecture du PDF: {str(e)}")
+
+
+def clean_pdf_text(pages: List[str]) -> str:
+    """Nettoie le texte des pages avant envoi au LLM (en-têtes/pieds de page répétés, espaces, sommaires)"""
+    # Une seule normalisation pour tout le document plutôt qu'un appel par page
+    # (NFKC laisse le séparateur de pages intact)
+    pages = unicodedata.normalize("NFKC", PAGE_SEPARATOR.join(pages)).split(PAGE_SEPARATOR)
+    
+    # Les lignes présentes sur plus de la moitié des pages sont des en-têtes/pieds de page
+    repeated = set()
+    if len(pages) > 2:
+        line_counts = Counter()
+        for page in pages:
+            line_counts.update({line.strip() for line in page.splitlines() if line.strip()})
+        repeated = {line for line, count in line_counts.items() if count > len(pages) / 2}
     
-    return provider.extract_info(text, prompt)
+    # Nettoyage page par page: les limites de pages sont conservées pour le découpage en tokens
+    cleaned_pages = []
+    for page in pages:
+        text = "\n".join(line for line in page.splitlines() if line.strip() not in repeated)
+        text = DOT_LEADER_PATTERN.sub("", text)
+        text = BLANK_LINES_PATTERN.sub("\n", text)
+        text = WHITESPACE_PATTERN.sub(" ", text).strip()
+        if text:
+            cleaned_pages.append(text)
+    return PAGE_SEPARATOR.join(cleaned_pages)
+
+
+def extract_info_with_llm(text: str, filename: str) -> Dict[str, Any]:
+    """Utilise le LLM configuré pour extraire les informations structurées du texte"""
+    text_window = pack_pages(text)
+    cached = prompt_cache.lookup(PRODUCT_PROMPT_PARTS, filename, text_window)
+    if cached is not None:
+        return cached
+    
+    provider = get_llm_provider()
+    
+    # Pas de date dans le prompt: la réponse ne dépend que du document et reste valide en cache
+    # (is_end_of_life est calculé à l'enregistrement à partir de end_of_life_date)
+    user_prompt = PRODUCT_USER_TEMPLATE.format(
+        filename=filename,
+        text=text_window
+    )
+    
+    extracted_data = extract_validated(provider, PRODUCT_SYSTEM_PROMPT, user_prompt, ProductExtraction).model_dump()
+    prompt_cache.store(PRODUCT_PROMPT_PARTS, filename, text_window, extracted_data)
+    return extracted_data
+
+
+def parse_pdf_for_llm(pdf_path: str, sha256: Optional[str] = None) -> str:
+    """
+    Extrait et nettoie le texte d'un PDF (exécuté dans un process worker).
+    Un PDF scanné est rejeté sur ses premières pages, avant le parsing de tout le document.
+    """
+    pages = extract_pages_from_pdf(pdf_path, sha256, check_text_layer=True)
+    text = clean_pdf_text(pages)
+    if not text:
+        raise Exception("aucun texte exploitable dans le PDF")
+    return text
 
 
 def process_pdf_and_store(pdf_path: str, filename: str, db: Session) -> list[ProductModel]:
     """Traite un PDF et stocke TOUS les produits trouvés dans la base de données"""
-    # Extraire le texte
-    text = extract_text_from_pdf(pdf_path)
-    
-    # Extraire les informations avec le LLM
-    extracted_data = extract_info_with_llm(text, filename)
+    # Extraire le texte et les informations avec le LLM (ou depuis le cache)
+    extracted_data = extract_with_cache(
+        pdf_path, filename, parse_pdf_for_llm, extract_info_with_llm,
+        "products", PRODUCT_PROMPT_VERSION
+    )
     
+    products = store_products(extracted_data, filename, db)
+    db.commit()
+    return products
+
+
+def store_products(extracted_data: Dict[str, Any], filename: str, db: Session) -> list[ProductModel]:
+    """Stocke en base les produits extraits d'un PDF par le LLM"""
     products_created = []
-    document_date = extracted_data.get("document_date")
+    rows = []
+    extraction = ProductExtraction.model_validate(extracted_data)
     
     # Traiter chaque produit trouvé
-    products_list = extracted_data.get("products", [])
-    if not products_list:
-        return []
-    
-    for product_data in products_list:
-        model_name = product_data.get("model_name")
+    seen_names = set()
+    for product in extraction.products:
+        model_name = product.model_name
         if not model_name or model_name == "null":
             continue
         
-        # Vérifier si le produit existe déjà
-        existing = db.query(ProductModel).filter(ProductModel.model_name == model_name).first()
-        if existing:
-            products_created.append(existing)
+        # Le LLM peut citer deux fois le même modèle: model_name est unique en base
+        if model_name in seen_names:
             continue
+        seen_names.add(model_name)
         
-        # Créer l'entrée dans la base de données
-        product = ProductModel(
-            model_name=model_name,
-            product_type=product_data.get("product_type"),
-            document_date=document_date,  # Date du document (commune à tous)
-            is_end_of_life=product_data.get("is_end_of_life", False),
-            end_of_life_date=product_data.get("end_of_life_date"),
-            end_of_support_date=product_data.get("end_of_support_date"),
-            status=product_data.get("status"),
-            functionalities=product_data.get("functionalities"),
-            alternatives=product_data.get("alternatives"),
-            release_date=product_data.get("release_date"),
-            description=product_data.get("description"),
-            notes=product_data.get("notes"),
-            source_file=filename,
-            raw_data=product_data
-        )
-        
-        db.add(product)
-        products_created.append(product)
+        # Préparer la ligne à insérer
+        is_end_of_life = end_of_life_reached(product.end_of_life_date)
+        rows.append({
+            "model_name": model_name,
+            "product_type": product.product_type,
+            "document_date": extraction.document_date,  # Date du document (commune à tous)
+            "is_end_of_life": is_end_of_life,
+            "end_of_life_date": product.end_of_life_date,
+            "end_of_support_date": product.end_of_support_date,
+            "status": "End of Life" if is_end_of_life else product.status,
+            "functionalities": product.functionalities,
+            "alternatives": product.alternatives,
+            "release_date": product.release_date,
+            "description": product.description,
+            "notes": product.notes,
+            "source_file": filename,
+            "raw_data": product.model_dump()
+        })
     
-    db.commit()
-    for product in products_created:
-        if product.id is None:  # Refresh only newly created products
-            db.refresh(product)
+    # Un seul INSERT multi-lignes (statement mis en cache), sans SELECT préalable par produit:
+    # les modèles déjà en base sont ignorés par PostgreSQL (contrainte unique sur model_name)
+    # et RETURNING renvoie les produits créés avec leurs ids
+    if rows:
+        created = db.scalars(
+            insert(ProductModel).on_conflict_do_nothing(index_elements=["model_name"]).returning(ProductModel),
+            rows
+        ).all()
+        products_created.extend(created)
+        
+        # Les modèles déjà connus sont relus en une seule requête
+        created_names = {product.model_name for product in created}
+        existing_names = [row["model_name"] for row in rows if row["model_name"] not in created_names]
+        if existing_names:
+            products_created.extend(
+                db.scalars(select(ProductModel).where(ProductModel.model_name.in_(existing_names))).all()
+            )
     
+    # Le commit est à la charge de l'appelant (une transaction pour plusieurs PDFs)
     return products_created
 
 
@@ -187,16 +399,31 @@ def process_all_pdfs(assets_dir: str, db: Session) -> list[ProductModel]:
     if not os.path.exists(assets_dir):
         raise Exception(f"Le dossier {assets_dir} n'existe pas")
     
-    pdf_files = [f for f in os.listdir(assets_dir) if f.endswith('.pdf')]
+    # Générateur: le traitement commence avant la fin du parcours du dossier
+    pdf_files = iter_pdf_files(assets_dir)
     
-    for pdf_file in pdf_files:
-        pdf_path = os.path.join(assets_dir, pdf_file)
+    extractions = iter_extractions(
+        assets_dir, pdf_files, parse_pdf_for_llm, extract_info_with_llm,
+        "products", PRODUCT_PROMPT_VERSION
+    )
+    stored_files = 0
+    for pdf_file, extracted_data, error in extractions:
+        if error is not None:
+            print(f"Erreur lors du traitement de {pdf_file}: {str(error)}")
+            continue
         try:
-            products = process_pdf_and_store(pdf_path, pdf_file, db)  # Now returns a list
+            # Savepoint par PDF: une erreur n'annule que ce fichier, pas tout le lot
+            with db.begin_nested():
+                products = store_products(extracted_data, pdf_file, db)
             if products:  # Only add if valid products were extracted
-                results.extend(products)  # Use extend instead of append
+                results.extend(products)
         except Exception as e:
             print(f"Erreur lors du traitement de {pdf_file}: {str(e)}")
             continue
+        
+        stored_files += 1
+        if stored_files % COMMIT_EVERY_FILES == 0:
+            db.commit()
     
+    db.commit()
     return results
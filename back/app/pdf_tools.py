@@ -1,11 +1,23 @@
 """PDF Tools for LLM Function Calling"""
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Iterator, Tuple
+from collections import defaultdict, deque
 import os
-import pypdf
+import fitz  # PyMuPDF
+from sqlalchemy import String, literal, select, union_all
 from sqlalchemy.orm import Session
 from app.models import GatewayVersion, EdgeVersion, OrchestratorVersion
+from app import text_cache
+from app.pdf_processor import extract_pages_from_pdf, iter_page_texts
+from app.pdf_pipeline import iter_pdf_entries
 
 
+CONTEXT_LINES = 5  # Context lines kept before/after a version occurrence
+MAX_EXCERPTS_PER_PDF = 3
+
+# Index filename -> path of the PDFs in the assets directory, rebuilt when its mtime changes
+_PDF_INDEX: Dict[str, str] = {}
+_PDF_INDEX_MTIME = 0
+
 # Function definitions for LLM tool calling
 PDF_RETRIEVAL_TOOLS = [
     {
@@ -86,66 +98,53 @@ def list_available_pdfs(component_type: str = "all", db: Session = None) -> Dict
         return {"pdfs": [], "total": 0, "error": "Assets directory not found"}
     
     # Map source files from database to component types
-    pdf_metadata = {}
+    # Sets avoid O(n) membership tests and duplicate versions; materialized to lists once below
+    pdf_metadata = defaultdict(lambda: {"component_types": set(), "versions": set(), "dates": set()})
     
     if db:
-        # Get all versions with source files
-        for Model in [GatewayVersion, EdgeVersion, OrchestratorVersion]:
-            comp_type = Model.__tablename__.replace('_versions', '')
-            versions = db.query(Model).filter(Model.source_file.isnot(None)).all()
+        # Get all versions with source files, for the three components in a single round-trip
+        versions_query = union_all(*[
+            select(
+                Model.source_file,
+                literal(Model.__tablename__.replace('_versions', ''), String).label("component"),
+                Model.version,
+                Model.document_date
+            ).where(Model.source_file.isnot(None))
+            for Model in [GatewayVersion, EdgeVersion, OrchestratorVersion]
+        ])
+        
+        for source_file, comp_type, version, document_date in db.execute(versions_query):
+            metadata = pdf_metadata[source_file]
+            metadata["component_types"].add(comp_type)
+            metadata["versions"].add((version, comp_type))
             
-            for ver in versions:
-                filename = ver.source_file
-                if filename not in pdf_metadata:
-                    pdf_metadata[filename] = {
-                        "filename": filename,
-                        "component_types": [],
-                        "versions": [],
-                        "dates": set()
-                    }
-                
-                if comp_type not in pdf_metadata[filename]["component_types"]:
-                    pdf_metadata[filename]["component_types"].append(comp_type)
-                
-                pdf_metadata[filename]["versions"].append({
-                    "version": ver.version,
-                    "component": comp_type,
-                    "is_eol": ver.is_end_of_life,
-                    "eol_date": ver.end_of_life_date
-                })
-                
-                if ver.document_date:
-                    pdf_metadata[filename]["dates"].add(ver.document_date)
+            if document_date:
+                metadata["dates"].add(document_date)
     
     # List actual PDF files
-    for root, dirs, files in os.walk(assets_dir):
-        for file in files:
-            if file.endswith('.pdf'):
-                full_path = os.path.join(root, file)
-                relative_path = os.path.relpath(full_path, assets_dir)
-                
-                # Get metadata if available
-                metadata = pdf_metadata.get(file, {
-                    "filename": file,
-                    "component_types": ["unknown"],
-                    "versions": [],
-                    "dates": set()
-                })
-                
-                # Filter by component type
-                if component_type != "all":
-                    if component_type not in metadata.get("component_types", []):
-                        continue
-                
-                pdf_files.append({
-                    "filename": file,
-                    "relative_path": relative_path,
-                    "component_types": metadata.get("component_types", []),
-                    "versions_count": len(metadata.get("versions", [])),
-                    "sample_versions": [v["version"] for v in metadata.get("versions", [])][:5],
-                    "document_dates": list(metadata.get("dates", [])),
-                    "file_size_kb": round(os.path.getsize(full_path) / 1024, 2)
-                })
+    for entry in iter_pdf_entries(assets_dir, recursive=True):
+        file = entry.name
+        relative_path = os.path.relpath(entry.path, assets_dir)
+        
+        # Get metadata if available
+        metadata = pdf_metadata.get(file)
+        component_types = sorted(metadata["component_types"]) if metadata else ["unknown"]
+        
+        # Filter by component type
+        if component_type != "all":
+            if component_type not in component_types:
+                continue
+        
+        versions = sorted(metadata["versions"]) if metadata else []
+        pdf_files.append({
+            "filename": file,
+            "relative_path": relative_path,
+            "component_types": component_types,
+            "versions_count": len(versions),
+            "sample_versions": [version for version, _ in versions[:5]],
+            "document_dates": list(metadata["dates"]) if metadata else [],
+            "file_size_kb": round(entry.stat().st_size / 1024, 2)
+        })
     
     return {
         "pdfs": pdf_files,
@@ -154,53 +153,93 @@ def list_available_pdfs(component_type: str = "all", db: Session = None) -> Dict
     }
 
 
+def _build_pdf_index(assets_dir: str, mtime: int) -> None:
+    """Scan the assets directory tree (first path wins for a duplicated filename)"""
+    global _PDF_INDEX, _PDF_INDEX_MTIME
+    index = {}
+    for entry in iter_pdf_entries(assets_dir, recursive=True):
+        index.setdefault(entry.name, entry.path)
+    _PDF_INDEX, _PDF_INDEX_MTIME = index, mtime
+
+
+def get_pdf_path(pdf_filename: str, assets_dir: str = "/app/assets") -> Optional[str]:
+    """Resolve a PDF filename to its path, using an index rebuilt only when the assets directory changes"""
+    try:
+        mtime = os.stat(assets_dir).st_mtime_ns
+    except OSError:
+        return None
+    
+    rebuilt = mtime != _PDF_INDEX_MTIME or not _PDF_INDEX
+    if rebuilt:
+        _build_pdf_index(assets_dir, mtime)
+    
+    pdf_path = _PDF_INDEX.get(pdf_filename)
+    if (pdf_path is None or not os.path.exists(pdf_path)) and not rebuilt:
+        # Only the root mtime is watched: a PDF added to or moved within a subdirectory
+        # is found by rescanning once before reporting it missing
+        _build_pdf_index(assets_dir, mtime)
+        pdf_path = _PDF_INDEX.get(pdf_filename)
+    return pdf_path
+
+
+def parse_page_range(page_range: str, total_pages: int):
+    """Convert a page range ('all', '10-15' or '5') to 0-based page indices"""
+    if page_range == "all":
+        return range(total_pages)
+    try:
+        if '-' in page_range:
+            start, end = map(int, page_range.split('-'))
+            return range(max(0, start-1), min(total_pages, end))
+        page_num = int(page_range) - 1
+        return [page_num] if 0 <= page_num < total_pages else []
+    except:
+        return range(total_pages)
+
+
 def get_pdf_content(pdf_filename: str, page_range: str = "all") -> Dict[str, Any]:
     """Get full or partial content of a PDF"""
     assets_dir = "/app/assets"
     
     # Find the PDF file
-    pdf_path = None
-    for root, dirs, files in os.walk(assets_dir):
-        if pdf_filename in files:
-            pdf_path = os.path.join(root, pdf_filename)
-            break
+    pdf_path = get_pdf_path(pdf_filename, assets_dir)
     
     if not pdf_path or not os.path.exists(pdf_path):
         return {
             "error": f"PDF file '{pdf_filename}' not found",
-            "available_pdfs": [f for f in os.listdir(assets_dir) if f.endswith('.pdf')]
+            "available_pdfs": sorted(_PDF_INDEX)
         }
     
     try:
-        content = ""
-        total_pages = 0
+        content_parts = []
         
-        with open(pdf_path, 'rb') as file:
-            pdf_reader = pypdf.PdfReader(file)
-            total_pages = len(pdf_reader.pages)
-            
-            # Parse page range
-            if page_range == "all":
-                pages_to_read = range(total_pages)
-            else:
-                try:
-                    if '-' in page_range:
-                        start, end = map(int, page_range.split('-'))
-                        pages_to_read = range(max(0, start-1), min(total_pages, end))
-                    else:
-                        page_num = int(page_range) - 1
-                        pages_to_read = [page_num] if 0 <= page_num < total_pages else []
-                except:
-                    pages_to_read = range(total_pages)
-            
-            # Extract text
-            for page_num in pages_to_read:
-                try:
-                    page = pdf_reader.pages[page_num]
-                    content += f"\n--- Page {page_num + 1} ---\n"
-                    content += page.extract_text()
-                except Exception as e:
-                    content += f"\n[Error reading page {page_num + 1}: {str(e)}]\n"
+        # Page text comes from the disk cache when the PDF was already extracted
+        digest = text_cache.file_digest(pdf_path)
+        total_pages = text_cache.page_count(digest)
+        if total_pages is not None:
+            pages_to_read = parse_page_range(page_range, total_pages)
+            read_page = lambda page_num: text_cache.load_page(digest, page_num) or ""
+        elif page_range == "all":
+            # Whole document requested: extracted once, which fills the cache
+            pages = extract_pages_from_pdf(pdf_path, digest)
+            total_pages = len(pages)
+            pages_to_read = range(total_pages)
+            read_page = pages.__getitem__
+        else:
+            # Range resolved against the page count first: only the requested pages are parsed
+            with fitz.open(pdf_path) as doc:
+                total_pages = doc.page_count
+                pages_to_read = parse_page_range(page_range, total_pages)
+                pages = {page_num: doc[page_num].get_text() for page_num in pages_to_read}
+            read_page = pages.__getitem__
+        
+        # Extract text
+        for page_num in pages_to_read:
+            content_parts.append(f"\n--- Page {page_num + 1} ---\n")
+            try:
+                content_parts.append(read_page(page_num))
+            except Exception as e:
+                content_parts.append(f"\n[Error reading page {page_num + 1}: {str(e)}]\n")
+        content = "".join(content_parts)
         
         return {
             "filename": pdf_filename,
@@ -218,6 +257,111 @@ def get_pdf_content(pdf_filename: str, page_range: str = "all") -> Dict[str, Any
         }
 
 
+def iter_pdf_pages(pdf_path: str) -> Iterator[Tuple[int, str]]:
+    """Lazily yield the pages of a PDF as (page number, text)"""
+    digest = text_cache.file_digest(pdf_path)
+    cached_page_count = text_cache.page_count(digest)
+    if cached_page_count is not None:
+        page_texts = (text_cache.load_page(digest, i) or "" for i in range(cached_page_count))
+    else:
+        page_texts = iter_page_texts(pdf_path)
+    
+    yield from enumerate(page_texts, start=1)
+
+
+def _build_excerpt(line_number: int, context_lines: List[str], search_terms: List[str]) -> Optional[Dict[str, Any]]:
+    """Build an excerpt if the context contains the search terms"""
+    context = '\n'.join(context_lines)
+    context_lower = context.lower()
+    matches_terms = [term for term in search_terms if term.lower() in context_lower]
+    if search_terms and not matches_terms:
+        return None
+    return {
+        "line_number": line_number,
+        "context": context,
+        "matches_terms": matches_terms
+    }
+
+
+def _match_line_indices(text: str, needle: str) -> List[int]:
+    """Indices of the lines containing needle, located with str.find / str.count instead of a per-line loop"""
+    indices = []
+    line_index = 0
+    scanned = 0
+    pos = text.find(needle)
+    while pos != -1:
+        line_index += text.count('\n', scanned, pos)
+        indices.append(line_index)
+        line_end = text.find('\n', pos)
+        if line_end == -1:
+            break
+        # Only one occurrence per line: the search resumes on the next line
+        scanned = line_end
+        pos = text.find(needle, line_end + 1)
+    return indices
+
+
+def find_version_excerpts(
+    pdf_path: str,
+    version_number: str,
+    search_terms: List[str],
+    max_excerpts: int = MAX_EXCERPTS_PER_PDF
+) -> List[Dict[str, Any]]:
+    """Search a PDF for a version, stopping as soon as max_excerpts excerpts are found"""
+    excerpts = []
+    previous_lines = deque(maxlen=CONTEXT_LINES)
+    open_matches = []  # [line number, context lines, following lines still needed]
+    
+    line_number = 0
+    
+    def add_excerpt(match_line: int, context_lines: List[str]) -> bool:
+        excerpt = _build_excerpt(match_line, context_lines, search_terms)
+        if excerpt:
+            excerpts.append(excerpt)
+        return len(excerpts) >= max_excerpts
+    
+    for _, page_text in iter_pdf_pages(pdf_path):
+        # Page without occurrence and no pending context: a single search
+        # over the page text, without splitting it into lines
+        if not open_matches and version_number not in page_text:
+            previous_lines.extend(page_text.rsplit('\n', CONTEXT_LINES)[-CONTEXT_LINES:])
+            line_number += page_text.count('\n') + 1
+            continue
+        
+        lines = page_text.split('\n')
+        
+        # Contexts still open from previous pages: completed with the first lines
+        still_open = []
+        for match_line, context_lines, remaining in open_matches:
+            context_lines.extend(lines[:remaining])
+            remaining -= min(remaining, len(lines))
+            if remaining:
+                still_open.append([match_line, context_lines, remaining])
+            elif add_excerpt(match_line, context_lines):
+                return excerpts
+        open_matches = still_open
+        
+        # Context: 5 lines before and 5 lines after, sliced directly from the page
+        for index in _match_line_indices(page_text, version_number):
+            before = (list(previous_lines) + lines[max(0, index - CONTEXT_LINES):index])[-CONTEXT_LINES:]
+            after = lines[index:index + CONTEXT_LINES + 1]
+            remaining = CONTEXT_LINES + 1 - len(after)
+            if remaining:
+                open_matches.append([line_number + index + 1, before + after, remaining])
+            elif add_excerpt(line_number + index + 1, before + after):
+                return excerpts
+        
+        previous_lines.extend(lines[-CONTEXT_LINES:])
+        line_number += len(lines)
+    
+    # End of document: contexts still open are complete
+    for match_line, context_lines, _ in open_matches:
+        if add_excerpt(match_line, context_lines):
+            break
+    
+    return excerpts
+
+
 def search_pdf_for_version(
     version_number: str,
     component_type: str = "all",
@@ -225,47 +369,31 @@ def search_pdf_for_version(
     db: Session = None
 ) -> Dict[str, Any]:
     """Search for version information across PDFs"""
+    assets_dir = "/app/assets"
     search_terms = search_terms or []
     results = []
     
-    # Get list of PDFs to search
+    # Get list of PDFs to search (with their paths, no second directory walk)
     pdf_list = list_available_pdfs(component_type, db)
     
     for pdf_info in pdf_list["pdfs"]:
         # Quick check from metadata
-        if version_number in [v for v in pdf_info.get("sample_versions", [])]:
-            # Get full content and search
-            content_result = get_pdf_content(pdf_info["filename"])
+        if version_number in pdf_info.get("sample_versions", []):
+            pdf_path = os.path.join(assets_dir, pdf_info["relative_path"])
+            
+            try:
+                # Lazy page-by-page scan, stops after the top excerpts
+                relevant_sections = find_version_excerpts(pdf_path, version_number, search_terms)
+            except Exception:
+                continue
             
-            if "error" not in content_result:
-                content = content_result["content"]
-                
-                # Search for version and terms
-                relevant_sections = []
-                lines = content.split('\n')
-                
-                for i, line in enumerate(lines):
-                    if version_number in line:
-                        # Get context (5 lines before and after)
-                        start = max(0, i - 5)
-                        end = min(len(lines), i + 6)
-                        context = '\n'.join(lines[start:end])
-                        
-                        # Check if search terms present
-                        if not search_terms or any(term.lower() in context.lower() for term in search_terms):
-                            relevant_sections.append({
-                                "line_number": i + 1,
-                                "context": context,
-                                "matches_terms": [term for term in search_terms if term.lower() in context.lower()]
-                            })
-                
-                if relevant_sections:
-                    results.append({
-                        "filename": pdf_info["filename"],
-                        "component_types": pdf_info["component_types"],
-                        "matches_count": len(relevant_sections),
-                        "excerpts": relevant_sections[:3]  # Limit to top 3 excerpts per PDF
-                    })
+            if relevant_sections:
+                results.append({
+                    "filename": pdf_info["filename"],
+                    "component_types": pdf_info["component_types"],
+                    "matches_count": len(relevant_sections),
+                    "excerpts": relevant_sections
+                })
     
     return {
         "version": version_number,
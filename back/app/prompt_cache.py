@@ -0,0 +1,57 @@
+"""Cache disque des réponses d'extraction, indexé par le prompt exact envoyé au LLM"""
+from typing import Dict, Any, Optional, Tuple
+from functools import lru_cache
+import hashlib
+import orjson
+import os
+import threading
+from app.extraction_cache import provider_id
+
+
+CACHE_DIR = os.getenv("PROMPT_CACHE_DIR", "./.cache/prompts")
+
+
+def prompt_parts(prompt_version: str, *templates: str, schema: Any = None) -> Tuple[str, ...]:
+    """
+    Partie statique du prompt: version, templates (système, utilisateur, lots) et schéma de validation.
+    Toute modification de l'un d'eux change la clé et invalide les réponses en cache.
+    """
+    schema_json = orjson.dumps(schema.model_json_schema(), option=orjson.OPT_SORT_KEYS).decode() if schema else ""
+    return (prompt_version, *templates, schema_json)
+
+
+def template_hash(parts: Tuple[str, ...]) -> str:
+    """Hash de la partie statique du prompt et du modèle LLM utilisé"""
+    return _template_hash(provider_id(), parts)
+
+
+@lru_cache(maxsize=32)
+def _template_hash(provider: str, parts: Tuple[str, ...]) -> str:
+    # Quelques prompts seulement, hachés à chaque lookup/store: calculé une fois par prompt
+    return hashlib.sha256("\0".join((provider, *parts)).encode("utf-8")).hexdigest()
+
+
+def _entry_path(parts: Tuple[str, ...], filename: str, text: str) -> str:
+    """Une entrée par (prompt, fichier, texte envoyé): seul un prompt identique réutilise la réponse"""
+    text_hash = hashlib.sha256(f"{filename}|{text}".encode("utf-8")).hexdigest()
+    return os.path.join(CACHE_DIR, template_hash(parts), f"{text_hash}.json")
+
+
+def lookup(parts: Tuple[str, ...], filename: str, text: str) -> Optional[Dict[str, Any]]:
+    """Retourne la réponse déjà obtenue pour ce prompt, ce fichier et ce texte"""
+    try:
+        with open(_entry_path(parts, filename, text), "rb") as f:
+            response = orjson.loads(f.read())
+    except (OSError, ValueError):
+        return None
+    return response if isinstance(response, dict) else None
+
+
+def store(parts: Tuple[str, ...], filename: str, text: str, response: Dict[str, Any]) -> None:
+    """Enregistre la réponse du LLM (écriture atomique, sans verrou: un fichier par entrée)"""
+    path = _entry_path(parts, filename, text)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(orjson.dumps(response))
+    os.replace(tmp_path, path)
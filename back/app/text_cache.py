@@ -0,0 +1,72 @@
+"""Cache disque du texte extrait des PDFs, page par page"""
+from typing import Dict, List, Optional, Tuple
+import json
+import os
+from app.extraction_cache import file_sha256
+
+
+CACHE_DIR = os.getenv("TEXT_CACHE_DIR", "./.cache/text")
+META_FILENAME = "meta.json"  # Écrit en dernier: sa présence signifie que le cache est complet
+
+# sha256 déjà calculés, invalidés par la date de modification et la taille du fichier
+_digests: Dict[Tuple[str, int, int], str] = {}
+
+
+def file_digest(pdf_path: str) -> str:
+    """sha256 du PDF, recalculé uniquement si le fichier a changé"""
+    stat = os.stat(pdf_path)
+    key = (os.path.abspath(pdf_path), stat.st_mtime_ns, stat.st_size)
+    if key not in _digests:
+        _digests[key] = file_sha256(pdf_path)
+    return _digests[key]
+
+
+def _page_path(digest: str, page_index: int) -> str:
+    return os.path.join(CACHE_DIR, digest, f"{page_index}.txt")
+
+
+def page_count(digest: str) -> Optional[int]:
+    """Nombre de pages du PDF en cache, None si le cache est absent ou incomplet"""
+    try:
+        with open(os.path.join(CACHE_DIR, digest, META_FILENAME), encoding="utf-8") as f:
+            return int(json.load(f)["page_count"])
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+
+
+def load_page(digest: str, page_index: int) -> Optional[str]:
+    """Texte d'une page en cache"""
+    try:
+        with open(_page_path(digest, page_index), encoding="utf-8") as f:
+            return f.read()
+    except OSError:
+        return None
+
+
+def load_pages(digest: str) -> Optional[List[str]]:
+    """Texte de toutes les pages en cache, None si le cache est absent ou incomplet"""
+    count = page_count(digest)
+    if count is None:
+        return None
+
+    pages = []
+    for page_index in range(count):
+        page = load_page(digest, page_index)
+        if page is None:
+            return None
+        pages.append(page)
+    return pages
+
+
+def store_pages(digest: str, pages: List[str]) -> None:
+    """Enregistre le texte de chaque page, puis le fichier meta qui marque le cache complet"""
+    os.makedirs(os.path.join(CACHE_DIR, digest), exist_ok=True)
+    for page_index, page in enumerate(pages):
+        with open(_page_path(digest, page_index), "w", encoding="utf-8") as f:
+            f.write(page)
+
+    meta_path = os.path.join(CACHE_DIR, digest, META_FILENAME)
+    tmp_path = f"{meta_path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({"page_count": len(pages)}, f)
+    os.replace(tmp_path, meta_path)
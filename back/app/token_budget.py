@@ -0,0 +1,54 @@
+"""Découpage du texte envoyé au LLM selon un budget de tokens, page par page"""
+import os
+from functools import lru_cache
+from typing import Optional
+import tiktoken
+
+
+PAGE_SEPARATOR = "\f"  # Sépare les pages dans le texte extrait, jamais envoyé au LLM
+TARGET_TOKENS = int(os.getenv("LLM_INPUT_TOKENS", "3500"))
+# Texte à lire au maximum pour remplir le budget (un token cl100k dépasse rarement 6 caractères)
+TARGET_CHARS = TARGET_TOKENS * 6
+
+
+@lru_cache(maxsize=1)
+def _encoding() -> Optional[tiktoken.Encoding]:
+    """
+    Tokenizer chargé une seule fois, au premier découpage et non à l'import du module:
+    le démarrage de l'API ne dépend pas du chargement (ou téléchargement) du vocabulaire.
+    Retourne None si le vocabulaire est introuvable (image sans cache et sans réseau).
+    """
+    try:
+        return tiktoken.get_encoding("cl100k_base")
+    except Exception as e:
+        print(f"Tokenizer cl100k_base indisponible, découpage au nombre de caractères: {str(e)}")
+        return None
+
+
+def pack_pages(text: str, max_tokens: int = TARGET_TOKENS) -> str:
+    """
+    Garde les premières pages entières qui tiennent dans le budget de tokens.
+    Si la première page dépasse déjà le budget, elle est tronquée au token près.
+    Sans tokenizer, le texte est tronqué à TARGET_CHARS caractères (à l'échelle de max_tokens).
+    """
+    encoding = _encoding()
+    if encoding is None:
+        max_chars = TARGET_CHARS * max_tokens // TARGET_TOKENS
+        return "\n".join(page.strip() for page in text.split(PAGE_SEPARATOR) if page.strip())[:max_chars]
+
+    kept_pages = []
+    remaining = max_tokens
+    for page in text.split(PAGE_SEPARATOR):
+        page = page.strip()
+        if not page:
+            continue
+
+        tokens = encoding.encode(page, disallowed_special=())
+        if len(tokens) > remaining:
+            if not kept_pages:
+                kept_pages.append(encoding.decode(tokens[:remaining]))
+            break
+        kept_pages.append(page)
+        remaining -= len(tokens) + 1  # +1 pour le saut de ligne entre les pages
+
+    return "\n".join(kept_pages)
@@ -1,33 +1,40 @@
 import os
-from pypdf import PdfReader
-from typing import Dict, Any, List
+import re
+from typing import Dict, Any, List, Optional, Tuple, Union
+from sqlalchemy import null
+from sqlalchemy.dialects.postgresql import insert
 from sqlalchemy.orm import Session
 from app.models import ProductModel, GatewayVersion, EdgeVersion, OrchestratorVersion
 from app.llm_provider import get_llm_provider
-from datetime import datetime
+from app.extraction_schemas import GatewayEdgeBatchExtraction, GatewayEdgeExtraction, end_of_life_reached, extract_validated
+from app import prompt_cache
+from app.pdf_processor import extract_leading_text
+from app.token_budget import pack_pages
+from app.pdf_pipeline import extract_with_cache, iter_extractions, iter_pdf_files, COMMIT_EVERY_FILES
 
 
-def extract_text_from_pdf(pdf_path: str) -> str:
-    """Extrait le texte d'un fichier PDF"""
-    try:
-        reader = PdfReader(pdf_path)
-        text = ""
-        for page in reader.pages:
-            text += page.extract_text() + "\n"
-        return text
-    except Exception as e:
-        raise Exception(f"Erreur lors de la lecture du PDF: {str(e)}")
+# Pré-filtre des PDFs avant l'appel LLM: un seul passage de regex sur le texte extrait
+COMPONENT_KEYWORDS_PATTERN = re.compile(r"\b(?:Gateway|Edge|Orchestrator|VCG|VCO)\b", re.IGNORECASE)
 
+# Champs des versions extraites recopiés tels quels dans les colonnes de même nom
+VERSION_KEYS = (
+    "version", "document_date", "release_date", "end_of_life_date", "end_of_support_date",
+    "status", "features", "upgrade_instructions", "notes"
+)
 
-def extract_gateway_edge_info(text: str, filename: str) -> Dict[str, Any]:
-    """Extrait les informations de Gateway et Edge avec leurs versions et dates EOL"""
-    provider = get_llm_provider()
-    current_date = datetime.now().strftime("%d/%m/%Y")
-    
-    prompt = f"""
-Analyse le texte suivant extrait d'un PDF sur des produits SD-WAN (VeloCloud/Arista) et extrait les informations au format JSON.
+# Version extraite valide: numéro seul (ex: "6.4.0"), sans nom de produit
+_VERSION_RE = re.compile(r"^\d+\.\d+(?:\.\d+)?$")
+
+# Pages utiles à l'extraction des versions: celles qui citent un numéro de version
+VERSION_MENTION_PATTERN = re.compile(r"\b\d+\.\d+(?:\.\d+)?\b")
 
-DATE ACTUELLE: {current_date}
+GATEWAY_EDGE_PROMPT_VERSION = "7"  # À incrémenter à chaque modification du prompt (invalide le cache)
+
+# Instructions et schéma d'extraction des versions: message système identique pour tous les PDFs
+# (préfixe stable, mis en cache côté provider)
+GATEWAY_EDGE_SYSTEM_PROMPT = """
+Tu es un assistant qui extrait des informations structurées de documents techniques.
+Analyse le texte fourni extrait d'un PDF sur des produits SD-WAN (VeloCloud/Arista) et extrait les informations au format JSON.
 
 IMPORTANT: Il existe 3 types de software distincts (UN seul software par type):
 - Gateway: logiciel pour passerelles/gateways
@@ -47,55 +54,52 @@ Exemples INCORRECTS:
 
 Extrait les informations suivantes au format JSON:
 
-{{
+{
   "document_type": "gateway_version" | "edge_version" | "orchestrator_version" | "lifecycle" | "release_notes",
   "gateways": [
-    {{
+    {
       "version": "X.Y.Z uniquement, sans nom de produit",
       "document_date": "date de publication du document/PDF au format DD/MM/YYYY (chercher 'Last Updated', 'Published', 'Document Date')",
       "release_date": "date de release de cette version software au format DD/MM/YYYY",
       "end_of_life_date": "date de fin de vie au format DD/MM/YYYY si mentionnée",
       "end_of_support_date": "date de fin de support au format DD/MM/YYYY si mentionnée",
-      "is_end_of_life": true/false (calculer automatiquement: true si end_of_life_date < DATE ACTUELLE, false sinon),
-      "status": "Active|Deprecated|End of Life (déterminer en fonction de is_end_of_life)",
+      "status": "Active|Deprecated|End of Life (selon le document)",
       "features": ["liste des fonctionnalités"],
       "upgrade_instructions": ["liste d'instructions importantes pour l'upgrade: pré-requis, dépendances, versions ESXi requises, versions Gateway/Edge/Orchestrator nécessaires, etc."],
       "notes": "notes importantes"
-    }}
+    }
   ],
   "edges": [
-    {{
+    {
       "version": "X.Y.Z uniquement, sans nom de produit",
       "document_date": "date de publication du document/PDF au format DD/MM/YYYY",
       "release_date": "date de release de cette version software au format DD/MM/YYYY",
       "end_of_life_date": "date de fin de vie au format DD/MM/YYYY si mentionnée",
       "end_of_support_date": "date de fin de support au format DD/MM/YYYY si mentionnée",
-      "is_end_of_life": true/false (calculer automatiquement: true si end_of_life_date < DATE ACTUELLE, false sinon),
-      "status": "Active|Deprecated|End of Life (déterminer en fonction de is_end_of_life)",
+      "status": "Active|Deprecated|End of Life (selon le document)",
       "features": ["liste des fonctionnalités"],
       "upgrade_instructions": ["liste d'instructions importantes pour l'upgrade: depuis quelle version peut-on upgrader, versions Gateway requises, pré-requis, etc."],
       "notes": "notes importantes"
-    }}
+    }
   ],
   "orchestrators": [
-    {{
+    {
       "version": "X.Y.Z uniquement, sans nom de produit",
       "document_date": "date de publication du document/PDF au format DD/MM/YYYY",
       "release_date": "date de release de cette version software au format DD/MM/YYYY",
       "end_of_life_date": "date de fin de vie au format DD/MM/YYYY si mentionnée",
       "end_of_support_date": "date de fin de support au format DD/MM/YYYY si mentionnée",
-      "is_end_of_life": true/false (calculer automatiquement: true si end_of_life_date < DATE ACTUELLE, false sinon),
-      "status": "Active|Deprecated|End of Life (déterminer en fonction de is_end_of_life)",
+      "status": "Active|Deprecated|End of Life (selon le document)",
       "features": ["liste des fonctionnalités"],
       "upgrade_instructions": ["liste d'instructions importantes pour l'upgrade: versions Gateway/Edge compatibles, pré-requis, dépendances, etc."],
       "notes": "notes importantes"
-    }}
+    }
   ],
-  "general_info": {{
+  "general_info": {
     "description": "résumé du document",
     "key_points": ["points importants"]
-  }}
-}}
+  }
+}
 
 IMPORTANT - FORMAT DES DATES:
 TOUTES les dates doivent être au format DD/MM/YYYY (jour/mois/année).
@@ -103,120 +107,180 @@ Exemples: "15/03/2025", "01/12/2026", "30/06/2024"
 
 Si une information n'est pas disponible, utilise null. Si le document ne contient pas de gateways, edges ou orchestrators, laisse les listes vides.
 
-Nom du fichier: {filename}
+Réponds uniquement avec le JSON, sans texte additionnel.
+"""
 
-Texte (premiers 6000 caractères):
-{text[:6000]}
+# Partie variable, envoyée dans le message utilisateur
+GATEWAY_EDGE_USER_TEMPLATE = """Nom du fichier: {filename}
+
+Texte:
+{text}
+"""
+
+# Plusieurs PDFs dans un même appel: consignes en tête du message utilisateur
+# (le message système, mis en cache côté provider, reste identique)
+GATEWAY_EDGE_BATCH_INSTRUCTIONS = """Ce message contient plusieurs documents, chacun précédé de "=== Document: <nom du fichier> ===".
+Extrais les informations de CHAQUE document séparément, sans mélanger leurs contenus.
+Réponds avec un seul objet JSON: {"documents": {"<nom du fichier>": <JSON attendu pour ce document>}}
+
+"""
+
+GATEWAY_EDGE_BATCH_DOCUMENT_TEMPLATE = """=== Document: {filename} ===
+{text}
 
-Réponds uniquement avec le JSON, sans texte additionnel.
 """
+
+# Clé du cache de prompts: une réponse n'est réutilisée qu'avec la même version, les mêmes templates et le même schéma
+# (le schéma des lots inclut celui d'un document seul)
+GATEWAY_EDGE_PROMPT_PARTS = prompt_cache.prompt_parts(
+    GATEWAY_EDGE_PROMPT_VERSION, GATEWAY_EDGE_SYSTEM_PROMPT, GATEWAY_EDGE_USER_TEMPLATE,
+    GATEWAY_EDGE_BATCH_INSTRUCTIONS, GATEWAY_EDGE_BATCH_DOCUMENT_TEMPLATE, schema=GatewayEdgeBatchExtraction
+)
+
+# Nombre de PDFs envoyés au LLM dans un même appel
+GATEWAY_EDGE_BATCH_SIZE = int(os.getenv("LLM_BATCH_SIZE", "4"))
+
+
+def extract_version_pages(pdf_path: str, sha256: Optional[str] = None) -> str:
+    """Texte de la première page (titre, date) puis des pages qui citent un numéro de version"""
+    return extract_leading_text(pdf_path, sha256, keep_page=VERSION_MENTION_PATTERN.search)
+
+
+def extract_gateway_edge_info(text: str, filename: str) -> Dict[str, Any]:
+    """Extrait les informations de Gateway et Edge avec leurs versions et dates EOL"""
+    return extract_gateway_edge_info_batch([(text, filename)])[filename]
+
+
+def extract_gateway_edge_info_batch(items: List[Tuple[str, str]]) -> Dict[str, Union[Dict[str, Any], Exception]]:
+    """
+    Extrait les informations de plusieurs PDFs (texte, nom du fichier) avec un seul appel LLM.
+    Retourne les données extraites par nom de fichier, ou l'erreur de l'appel dédié qui a échoué.
+    """
+    results = {}
+    to_extract = []
+    for text, filename in items:
+        # Document sans aucune mention de composant SD-WAN: inutile d'appeler le LLM
+        if not COMPONENT_KEYWORDS_PATTERN.search(text):
+            results[filename] = {"gateways": [], "edges": [], "orchestrators": [], "skipped": True}
+            continue
+        
+        text_window = pack_pages(text)
+        cached = prompt_cache.lookup(GATEWAY_EDGE_PROMPT_PARTS, filename, text_window)
+        if cached is not None:
+            results[filename] = cached
+            continue
+        to_extract.append((filename, text_window))
+    
+    if not to_extract:
+        return results
     
-    return provider.extract_info(text, prompt)
+    provider = get_llm_provider()
+    
+    # Pas de date dans le prompt: la réponse ne dépend que du document et reste valide en cache
+    # (is_end_of_life est calculé à l'enregistrement à partir de end_of_life_date)
+    if len(to_extract) > 1:
+        user_prompt = GATEWAY_EDGE_BATCH_INSTRUCTIONS + "".join(
+            GATEWAY_EDGE_BATCH_DOCUMENT_TEMPLATE.format(filename=filename, text=text_window)
+            for filename, text_window in to_extract
+        )
+        try:
+            documents = extract_validated(
+                provider, GATEWAY_EDGE_SYSTEM_PROMPT, user_prompt, GatewayEdgeBatchExtraction
+            ).documents
+        except Exception as e:
+            # Réponse groupée tronquée, non JSON ou invalide: chaque document repasse en appel dédié
+            print(f"Extraction groupée échouée, repli document par document: {str(e)}")
+            documents = {}
+    else:
+        documents = {}
+    
+    for filename, text_window in to_extract:
+        extraction = documents.get(filename)
+        if extraction is None:
+            # Document seul, ou absent de la réponse groupée: appel dédié
+            user_prompt = GATEWAY_EDGE_USER_TEMPLATE.format(
+                filename=filename,
+                text=text_window
+            )
+            try:
+                extraction = extract_validated(provider, GATEWAY_EDGE_SYSTEM_PROMPT, user_prompt, GatewayEdgeExtraction)
+            except Exception as e:
+                # Seul ce document est en erreur, les autres du lot sont rendus normalement
+                results[filename] = e
+                continue
+        
+        extracted_data = extraction.model_dump()
+        prompt_cache.store(GATEWAY_EDGE_PROMPT_PARTS, filename, text_window, extracted_data)
+        results[filename] = extracted_data
+    
+    return results
 
 
 def process_pdf_with_gateway_edge(pdf_path: str, filename: str, db: Session) -> Dict[str, Any]:
     """Traite un PDF et stocke les informations de Gateway, Edge et Orchestrator dans la base de données"""
-    # Extraire le texte
-    text = extract_text_from_pdf(pdf_path)
-    
-    # Extraire les informations avec le LLM
-    extracted_data = extract_gateway_edge_info(text, filename)
+    # Extraire le texte et les informations avec le LLM (ou depuis le cache)
+    extracted_data = extract_with_cache(
+        pdf_path, filename, extract_version_pages, extract_gateway_edge_info,
+        "gateway_edge", GATEWAY_EDGE_PROMPT_VERSION
+    )
     
+    results = store_gateway_edge(extracted_data, filename, db)
+    db.commit()
+    return results
+
+
+def _validate_version(version: Optional[str]) -> bool:
+    """Écarte les versions vides, "Unknown" ou contenant un nom de produit ("VeloCloud Gateway v6.4.0")"""
+    return bool(version) and _VERSION_RE.match(version) is not None
+
+
+def store_gateway_edge(extracted_data: Dict[str, Any], filename: str, db: Session) -> Dict[str, Any]:
+    """Stocke en base les versions Gateway, Edge et Orchestrator extraites d'un PDF"""
     results = {
         "gateways": [],
         "edges": [],
         "orchestrators": [],
         "filename": filename
     }
+    extraction = GatewayEdgeExtraction.model_validate(extracted_data)
     
-    # Traiter les Gateways
-    gateways = extracted_data.get("gateways", [])
-    for gw in gateways:
-        version = gw.get("version")
-        if not version or version == "Unknown":
-            continue
-            
-        # Vérifier si la version existe déjà
-        existing = db.query(GatewayVersion).filter(GatewayVersion.version == version).first()
-        if existing:
-            continue
-            
-        gateway = GatewayVersion(
-            version=version,
-            document_date=gw.get("document_date"),
-            release_date=gw.get("release_date"),
-            end_of_life_date=gw.get("end_of_life_date"),
-            end_of_support_date=gw.get("end_of_support_date"),
-            is_end_of_life=gw.get("is_end_of_life", False),
-            status=gw.get("status"),
-            features=gw.get("features"),
-            upgrade_instructions=gw.get("upgrade_instructions"),
-            notes=gw.get("notes"),
-            source_file=filename,
-            raw_data=gw
-        )
-        db.add(gateway)
-        results["gateways"].append(gateway)
-    
-    # Traiter les Edges
-    edges = extracted_data.get("edges", [])
-    for ed in edges:
-        version = ed.get("version")
-        if not version or version == "Unknown":
-            continue
-            
-        # Vérifier si la version existe déjà
-        existing = db.query(EdgeVersion).filter(EdgeVersion.version == version).first()
-        if existing:
-            continue
+    # Traiter les Gateways, les Edges puis les Orchestrators
+    for Model, records, key in [
+        (GatewayVersion, extraction.gateways, "gateways"),
+        (EdgeVersion, extraction.edges, "edges"),
+        (OrchestratorVersion, extraction.orchestrators, "orchestrators")
+    ]:
+        rows = {}
+        for record in records:
+            version = record.version
+            # Une version citée deux fois dans le PDF n'est insérée qu'une fois (version unique en base)
+            if not _validate_version(version) or version in rows:
+                continue
             
-        edge = EdgeVersion(
-            version=version,
-            document_date=ed.get("document_date"),
-            release_date=ed.get("release_date"),
-            end_of_life_date=ed.get("end_of_life_date"),
-            end_of_support_date=ed.get("end_of_support_date"),
-            is_end_of_life=ed.get("is_end_of_life", False),
-            status=ed.get("status"),
-            features=ed.get("features"),
-            upgrade_instructions=ed.get("upgrade_instructions"),
-            notes=ed.get("notes"),
-            source_file=filename,
-            raw_data=ed
-        )
-        db.add(edge)
-        results["edges"].append(edge)
-    
-    # Traiter les Orchestrators
-    orchestrators = extracted_data.get("orchestrators", [])
-    for orch in orchestrators:
-        version = orch.get("version")
-        if not version or version == "Unknown":
+            row = {column: getattr(record, column) for column in VERSION_KEYS}
+            row["is_end_of_life"] = end_of_life_reached(row["end_of_life_date"])
+            if row["is_end_of_life"]:
+                row["status"] = "End of Life"
+            row["source_file"] = filename
+            # Seuls les champs sans colonne dédiée sont conservés, les autres seraient stockés deux fois.
+            # null(): NULL SQL (None serait enregistré comme JSON 'null' dans une colonne JSON)
+            row["raw_data"] = record.model_extra or null()
+            rows[version] = row
+        
+        if not rows:
             continue
-            
-        # Vérifier si la version existe déjà
-        existing = db.query(OrchestratorVersion).filter(OrchestratorVersion.version == version).first()
-        if existing:
-            continue
-            
-        orchestrator = OrchestratorVersion(
-            version=version,
-            document_date=orch.get("document_date"),
-            release_date=orch.get("release_date"),
-            end_of_life_date=orch.get("end_of_life_date"),
-            end_of_support_date=orch.get("end_of_support_date"),
-            is_end_of_life=orch.get("is_end_of_life", False),
-            status=orch.get("status"),
-            features=orch.get("features"),
-            upgrade_instructions=orch.get("upgrade_instructions"),
-            notes=orch.get("notes"),
-            source_file=filename,
-            raw_data=orch
-        )
-        db.add(orchestrator)
-        results["orchestrators"].append(orchestrator)
-    
-    db.commit()
+        
+        # Un seul INSERT multi-lignes par table, sans SELECT préalable: les versions déjà
+        # en base sont ignorées par PostgreSQL (contrainte unique sur version), sans course
+        # entre deux traitements concurrents. RETURNING donne les versions réellement ajoutées.
+        # Le commit est à la charge de l'appelant (une transaction pour tout un lot)
+        inserted = db.execute(
+            insert(Model)
+            .values(list(rows.values()))
+            .on_conflict_do_nothing(index_elements=["version"])
+            .returning(Model.version)
+        ).scalars().all()
+        results[key] = [rows[version] for version in inserted]
     
     return results
 
@@ -228,18 +292,35 @@ def process_all_pdfs_gateway_edge(assets_dir: str, db: Session) -> Dict[str, Any
         "total_edges": 0,
         "total_orchestrators": 0,
         "processed_files": [],
+        "skipped_files": [],
         "errors": []
     }
     
     if not os.path.exists(assets_dir):
         raise Exception(f"Le dossier {assets_dir} n'existe pas")
     
-    pdf_files = [f for f in os.listdir(assets_dir) if f.endswith('.pdf')]
+    # Générateur: le traitement commence avant la fin du parcours du dossier
+    pdf_files = iter_pdf_files(assets_dir)
     
-    for pdf_file in pdf_files:
-        pdf_path = os.path.join(assets_dir, pdf_file)
+    extractions = iter_extractions(
+        assets_dir, pdf_files, extract_version_pages, extract_gateway_edge_info,
+        "gateway_edge", GATEWAY_EDGE_PROMPT_VERSION,
+        extract_batch=extract_gateway_edge_info_batch,
+        batch_size=GATEWAY_EDGE_BATCH_SIZE
+    )
+    for pdf_file, extracted_data, error in extractions:
+        if error is not None:
+            error_msg = f"Erreur lors du traitement de {pdf_file}: {str(error)}"
+            print(error_msg)
+            results["errors"].append(error_msg)
+            continue
+        if extracted_data.get("skipped"):
+            results["skipped_files"].append(pdf_file)
+            continue
         try:
-            file_results = process_pdf_with_gateway_edge(pdf_path, pdf_file, db)
+            # Savepoint par PDF: une erreur n'annule que ce fichier, pas tout le lot
+            with db.begin_nested():
+                file_results = store_gateway_edge(extracted_data, pdf_file, db)
             results["total_gateways"] += len(file_results["gateways"])
             results["total_edges"] += len(file_results["edges"])
             results["total_orchestrators"] += len(file_results["orchestrators"])
@@ -254,5 +335,11 @@ def process_all_pdfs_gateway_edge(assets_dir: str, db: Session) -> Dict[str, Any
             print(error_msg)
             results["errors"].append(error_msg)
             continue
+        
+        # Une transaction par groupe de PDFs plutôt qu'une par fichier
+        if len(results["processed_files"]) % COMMIT_EVERY_FILES == 0:
+            db.commit()
+    
+    db.commit()
     
     return results